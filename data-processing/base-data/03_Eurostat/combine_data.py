@@ -1,6 +1,15 @@
+import argparse
 import pandas as pd
 import numpy as np
 
+parser = argparse.ArgumentParser(description='Combine Eurostat sector consumption TSVs into one long-format table.')
+parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                    help='Output format; parquet stores the id columns dictionary-encoded (needs pyarrow)')
+args = parser.parse_args()
+
+# Low-cardinality id columns, dictionary-encoded in the parquet output
+DICTIONARY_COLS = ['sector', 'freq', 'siec', 'unit', 'geo', 'category']
+
 def parse_eurostat_tsv(filepath, sector_name):
     try:
         df = pd.read_csv(filepath, sep='\t')
@@ -76,8 +85,14 @@ combined_long['value'] = pd.to_numeric(combined_long['value'], errors='coerce')
 combined_long['year'] = combined_long['year'].astype(int)
 
 # Save to CSV
-output_path = '../output/eurostat_sector_consumption_combined_2010-2023.csv'
-combined_long.to_csv(output_path, index=False)
+if args.format == 'parquet':
+    output_path = '../output/eurostat_sector_consumption_combined_2010-2023.parquet'
+    for col in DICTIONARY_COLS:
+        combined_long[col] = combined_long[col].astype('category')
+    combined_long.to_parquet(output_path, index=False, compression='zstd')
+else:
+    output_path = '../output/eurostat_sector_consumption_combined_2010-2023.csv'
+    combined_long.to_csv(output_path, index=False)
 print(f'Saved to: {output_path}')
 print(f'Final shape: {combined_long.shape}')
 print()
@@ -88,4 +103,4 @@ print('Value statistics:')
 print(combined_long['value'].describe())
 print()
 print('Sectors breakdown:')
-print(combined_long.groupby('sector').size())
\ No newline at end of file
+print(combined_long.groupby('sector', observed=True).size())
\ No newline at end of file
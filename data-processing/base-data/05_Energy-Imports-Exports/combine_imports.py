@@ -1,6 +1,15 @@
+import argparse
 import pandas as pd
 import numpy as np
 
+parser = argparse.ArgumentParser(description='Combine Eurostat import dependency TSVs into one long-format table.')
+parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                    help='Output format; parquet stores the id columns dictionary-encoded (needs pyarrow)')
+args = parser.parse_args()
+
+# Low-cardinality id columns, dictionary-encoded in the parquet output
+DICTIONARY_COLS = ['indicator', 'freq', 'siec', 'partner', 'unit', 'geo']
+
 def parse_eurostat_tsv(filepath, indicator_name):
     """Parse Eurostat TSV format and add indicator column"""
     try:
@@ -76,8 +85,14 @@ combined_long['value'] = pd.to_numeric(combined_long['value'], errors='coerce')
 combined_long['year'] = combined_long['year'].astype(int)
 
 # Save to CSV
-output_path = 'output/combined_import_dependency.csv'
-combined_long.to_csv(output_path, index=False)
+if args.format == 'parquet':
+    output_path = 'output/combined_import_dependency.parquet'
+    for col in DICTIONARY_COLS:
+        combined_long[col] = combined_long[col].astype('category')
+    combined_long.to_parquet(output_path, index=False, compression='zstd')
+else:
+    output_path = 'output/combined_import_dependency.csv'
+    combined_long.to_csv(output_path, index=False)
 print(f'Saved to: {output_path}')
 print(f'Final shape: {combined_long.shape}')
 print()
@@ -85,7 +100,7 @@ print('Sample rows:')
 print(combined_long[combined_long['value'].notna()].head(10).to_string())
 print()
 print('Indicators breakdown:')
-print(combined_long.groupby('indicator').size())
+print(combined_long.groupby('indicator', observed=True).size())
 print()
 print('Non-null values by indicator:')
-print(combined_long.groupby('indicator')['value'].apply(lambda x: x.notna().sum()))
+print(combined_long.groupby('indicator', observed=True)['value'].apply(lambda x: x.notna().sum()))
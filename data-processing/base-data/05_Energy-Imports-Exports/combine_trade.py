@@ -1,22 +1,105 @@
+import argparse
+import json
 import pandas as pd
 import numpy as np
 
-def parse_eurostat_tsv(filepath, flow_type, energy_type):
-    """Parse Eurostat TSV format and add flow/energy columns"""
+parser = argparse.ArgumentParser(description='Combine Eurostat energy trade TSVs into one long-format table.')
+parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                    help='Output format; parquet stores the id columns dictionary-encoded (needs pyarrow)')
+parser.add_argument('--block-size', type=int, default=10_000,
+                    help='TSV rows converted per block; bounds peak memory independent of file/year count')
+parser.add_argument('--sparse', action='store_true',
+                    help='Only write non-null observations of non-aggregate geos/partners')
+args = parser.parse_args()
+
+# Low-cardinality id columns, dictionary-encoded in the parquet output
+DICTIONARY_COLS = ['flow', 'energy_type', 'freq', 'siec', 'partner', 'unit', 'geo']
+
+# Define common columns
+common_cols = ['flow', 'energy_type', 'freq', 'siec', 'partner', 'unit', 'geo']
+output_cols = common_cols + ['year', 'value']
+
+# Aggregate reporters/partners dropped in --sparse mode
+# (same lists as create_imports_exports_json.py filters out)
+AGGREGATE_GEOS = ['EU27_2020', 'EA20']
+AGGREGATE_PARTNERS = ['TOTAL', 'THRD', 'NSP']
+
+def read_eurostat_tsv_blocks(filepath, block_size):
+    """Open a Eurostat TSV for reading in blocks of rows"""
     try:
-        df = pd.read_csv(filepath, sep='\t')
+        return pd.read_csv(filepath, sep='\t', dtype=str, chunksize=block_size)
     except FileNotFoundError:
-        df = pd.read_csv('../../raw-data/energy_trade_eurostat/' + filepath, sep='\t')
+        return pd.read_csv('../../raw-data/energy_trade_eurostat/' + filepath, sep='\t', dtype=str, chunksize=block_size)
+
+def block_to_long(df, flow_type, energy_type):
+    """Convert one block of a wide Eurostat TSV into cleaned long-format rows"""
     first_col = df.columns[0]
     dim_names = first_col.replace('\\TIME_PERIOD', '').split(',')
     split_dims = df[first_col].str.split(',', expand=True)
     split_dims.columns = dim_names
     year_cols = [c for c in df.columns if c != first_col]
-    result = pd.concat([split_dims, df[year_cols]], axis=1)
-    result['flow'] = flow_type
-    result['energy_type'] = energy_type
-    result.columns = [c.strip() if isinstance(c, str) else c for c in result.columns]
-    return result
+    wide = pd.concat([split_dims, df[year_cols]], axis=1)
+    wide['flow'] = flow_type
+    wide['energy_type'] = energy_type
+    wide.columns = [c.strip() if isinstance(c, str) else c for c in wide.columns]
+    years = [c for c in wide.columns if c.isdigit()]
+
+    # Melt to long format
+    long = wide.melt(id_vars=common_cols, value_vars=years, var_name='year', value_name='value')
+
+    # Clean values
+    long['value'] = long['value'].astype(str).str.replace(r'[a-z]', '', regex=True).str.strip()
+    long['value'] = long['value'].replace([':', ''], np.nan)
+    long['value'] = pd.to_numeric(long['value'], errors='coerce')
+    long['year'] = long['year'].astype(int)
+    return long[output_cols]
+
+def drop_sparse_rows(long, dropped):
+    """Drop missing values and aggregate geos/partners, counting what was dropped"""
+    missing = long['value'].isna()
+    aggregate_geo = ~missing & long['geo'].isin(AGGREGATE_GEOS)
+    aggregate_partner = ~missing & ~aggregate_geo & long['partner'].isin(AGGREGATE_PARTNERS)
+    dropped['missing_value'] += int(missing.sum())
+    dropped['aggregate_geo'] += int(aggregate_geo.sum())
+    dropped['aggregate_partner'] += int(aggregate_partner.sum())
+    return long[~(missing | aggregate_geo | aggregate_partner)]
+
+def write_manifest(output_path, manifest):
+    """Write exact row counts next to the output (read by create_imports_exports_json.py)"""
+    manifest_path = output_path + '.manifest.json'
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+def open_output(fmt):
+    """Return (output_path, write_block, close) for the requested output format"""
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        output_path = 'output/combined_energy_trade.parquet'
+        schema = pa.schema(
+            [pa.field(c, pa.dictionary(pa.int32(), pa.string())) for c in common_cols] +
+            [pa.field('year', pa.int64()), pa.field('value', pa.float64())]
+        )
+        writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+
+        def write_block(long):
+            for col in DICTIONARY_COLS:
+                long[col] = long[col].astype('category')
+            writer.write_table(pa.Table.from_pandas(long, schema=schema, preserve_index=False))
+
+        return output_path, write_block, writer.close
+
+    output_path = 'output/combined_energy_trade.csv'
+    out = open(output_path, 'w', newline='')
+    header = [True]
+
+    def write_block(long):
+        long.to_csv(out, header=header[0], index=False)
+        header[0] = False
+
+    return output_path, write_block, out.close
 
 # Define all files
 files = [
@@ -32,61 +115,60 @@ files = [
     ('estat_nrg_te_eh.tsv', 'EXPORT', 'EH'),
 ]
 
-print('Loading and parsing all datasets...')
-dfs = []
-for filename, flow, energy in files:
-    df = parse_eurostat_tsv(filename, flow, energy)
-    print(f'  {flow} {energy}: {df.shape[0]:,} rows')
-    dfs.append(df)
-
-# Get all unique years
+# Stream each TSV block by block: only one block of wide rows (and its long
+# form) is held in memory at a time, however many files or year columns exist.
+print(f'Converting datasets in blocks of {args.block_size:,} rows...')
+output_path, write_block, close_output = open_output(args.format)
+summary = {}
+dropped = {'missing_value': 0, 'aggregate_geo': 0, 'aggregate_partner': 0}
 all_years = set()
-for df in dfs:
-    year_cols = [c for c in df.columns if c.isdigit()]
-    all_years.update(year_cols)
-all_years = sorted(all_years)
-print(f'Year range: {all_years[0]} to {all_years[-1]}')
-
-# Add missing year columns
-for df in dfs:
-    for year in all_years:
-        if year not in df.columns:
-            df[year] = np.nan
+total_rows = 0
+try:
+    for filename, flow, energy in files:
+        file_rows = 0
+        for block in read_eurostat_tsv_blocks(filename, args.block_size):
+            long = block_to_long(block, flow, energy)
+            if args.sparse:
+                long = drop_sparse_rows(long, dropped)
+            all_years.update(long['year'].unique().tolist())
+            counts = summary.setdefault((flow, energy), [0, 0])
+            counts[0] += len(long)
+            counts[1] += int(long['value'].notna().sum())
+            file_rows += len(block)
+            total_rows += len(long)
+            write_block(long)
+        print(f'  {flow} {energy}: {file_rows:,} rows')
+finally:
+    close_output()
 
-# Define common columns
-common_cols = ['flow', 'energy_type', 'freq', 'siec', 'partner', 'unit', 'geo']
-
-# Prepare and combine
-def prepare_df(df):
-    return df[common_cols + all_years]
-
-combined = pd.concat([prepare_df(df) for df in dfs], ignore_index=True)
-print(f'Combined wide format: {combined.shape[0]:,} rows')
-
-# Melt to long format
-combined_long = combined.melt(
-    id_vars=common_cols,
-    value_vars=all_years,
-    var_name='year',
-    value_name='value'
-)
-print(f'Combined long format: {combined_long.shape[0]:,} rows')
-
-# Clean values
-combined_long['value'] = combined_long['value'].astype(str).str.replace(r'[a-z]', '', regex=True).str.strip()
-combined_long['value'] = combined_long['value'].replace([':', ''], np.nan)
-combined_long['value'] = pd.to_numeric(combined_long['value'], errors='coerce')
-combined_long['year'] = combined_long['year'].astype(int)
-
-# Save
-output_path = 'output/combined_energy_trade.csv'
-combined_long.to_csv(output_path, index=False)
+# No rows kept (e.g. --sparse on an all-missing input): there is no year range
+year_range = [min(all_years), max(all_years)] if all_years else None
+if year_range:
+    print(f'Year range: {year_range[0]} to {year_range[1]}')
 print(f'Saved to: {output_path}')
-print(f'Final shape: {combined_long.shape[0]:,} rows x {combined_long.shape[1]} columns')
+print(f'Final shape: {total_rows:,} rows x {len(output_cols)} columns')
+if args.sparse:
+    print(f'Dropped (sparse): {dropped["missing_value"]:,} missing, '
+          f'{dropped["aggregate_geo"]:,} aggregate geo, {dropped["aggregate_partner"]:,} aggregate partner rows')
+
+rows_by_type = {}
+for (flow, energy), (rows, non_null) in sorted(summary.items()):
+    rows_by_type.setdefault(flow, {})[energy] = rows
+manifest_path = write_manifest(output_path, {
+    'file': output_path.split('/')[-1],
+    'format': args.format,
+    'sparse': args.sparse,
+    'rows': total_rows,
+    'non_null_rows': sum(non_null for _, non_null in summary.values()),
+    'rows_by_flow_energy_type': rows_by_type,
+    'dropped': dropped if args.sparse else None,
+    'year_range': year_range,
+})
+print(f'Manifest: {manifest_path}')
 print()
 
 print('Summary by flow & energy_type:')
-print(combined_long.groupby(['flow', 'energy_type']).agg(
-    rows=('value', 'size'),
-    non_null=('value', lambda x: x.notna().sum())
-))
+print(pd.DataFrame(
+    [(flow, energy, rows, non_null) for (flow, energy), (rows, non_null) in sorted(summary.items())],
+    columns=['flow', 'energy_type', 'rows', 'non_null']
+).set_index(['flow', 'energy_type']))
@@ -9,16 +9,29 @@ Reads:
 Outputs:
 - prepared-sets/energy_mix.json (augmented dataset)
 - Also copies to public/data/energy_mix.json
+- With --sharded: energy_mix/index.json + energy_mix/countries/<geo>.json
+  in both prepared-sets/ and public/data/
+- energy_mix/by_year/<year>.json snapshots (trade totals and partners of every
+  country in one year, for the trading partners map), also published
+
+With --stream the input is read and the output written one country at a time
+instead of holding the whole document (and its text) in memory; metadata then
+follows the countries in the output.
 """
 
-import pandas as pd
+import argparse
 import numpy as np
-import json
+import tempfile
 import time
-import shutil
+from collections.abc import Mapping
 from pathlib import Path
 from datetime import datetime
 
+import json_backend
+from owid_loader import load_owid, owid_production_consumption
+from output_writer import (write_json, write_json_stream, publish, publish_sharded, write_sharded, sharded_size,
+                           format_sizes, year_snapshots, write_year_snapshots)
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -29,6 +42,7 @@ OWID_FILE = BASE_DIR / 'raw-data' / 'energy_consumption' / 'owid-energy-data.xls
 MASTERSHEET = BASE_DIR / 'country_code_mastersheet.json'
 OUTPUT_JSON = BASE_DIR / 'prepared-sets' / 'energy_mix.json'
 PUBLIC_JSON = BASE_DIR.parent / 'public' / 'data' / 'energy_mix.json'
+OUTPUT_SHARDS = BASE_DIR / 'prepared-sets' / 'energy_mix'
 
 # OWID columns → internal energy type codes
 OWID_PRODUCTION_COLS = {
@@ -46,8 +60,262 @@ OWID_CONSUMPTION_COLS = {
     'electricity_demand': 'EH',
 }
 
+# Fields kept in the by_year snapshots (what TradingPartnersMap.vue reads)
+SNAPSHOT_FIELDS = {
+    'imports': ['total_by_type', 'partners_by_type'],
+    'exports': ['total_by_type', 'partners_by_type'],
+}
+# Metadata the web app needs to expand schema v2 partner tuples
+SNAPSHOT_METADATA = ['schema_version', 'partner_fields', 'energy_type_units']
+
+SAMPLE_COUNTRIES = ['DE', 'FR', 'IT', 'PL', 'ES']
+SAMPLE_YEARS = ['2000', '2015', '2023']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Augment energy_mix.json with OWID production/consumption.')
+    parser.add_argument('--sharded', action='store_true',
+                        help='Also write energy_mix/index.json and one file per country')
+    parser.add_argument('--pretty', action='store_true',
+                        help='Indent the JSON output instead of writing it compact')
+    parser.add_argument('--float-precision', type=int, default=None, metavar='N',
+                        help='Round every float in the output to N decimals')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read and write the dataset one country at a time (compact output only)')
+    args = parser.parse_args()
+    if args.stream and (args.sharded or args.pretty):
+        parser.error('--stream cannot be combined with --sharded or --pretty')
+    return args
+
+
+def snapshot_documents(metadata, country_lookup, by_year):
+    """{year: snapshot} documents from {year: {geo: map fields}}."""
+    kept = {key: metadata[key] for key in SNAPSHOT_METADATA if key in metadata}
+    return {
+        year: {
+            'metadata': {'generated': metadata['generated'], 'year': year, **kept},
+            'country_lookup': country_lookup,
+            'countries': countries,
+        }
+        for year, countries in sorted(by_year.items())
+    }
+
+
+def build_year_snapshots(data):
+    """{year: snapshot} with the map fields of every country that has trade data in that year."""
+    return snapshot_documents(data['metadata'], data.get('country_lookup', {}),
+                              year_snapshots(data['countries'], SNAPSHOT_FIELDS))
+
+
+class SpooledSnapshots(Mapping):
+    """{year: snapshot} for --stream, spooled to one JSON-lines file per year in `directory`.
+
+    add() appends a country's per-year fragments while the dataset streams
+    past; reading a year builds its document from that file, so
+    write_year_snapshots() only holds one year in memory at a time. Set
+    metadata and country_lookup before reading.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.metadata = {}
+        self.country_lookup = {}
+
+    def add(self, geo, country):
+        for year, geos in year_snapshots({geo: country}, SNAPSHOT_FIELDS).items():
+            with open(self.directory / f'{year}.jsonl', 'ab') as f:
+                f.write(json_backend.dumps([geo, geos[geo]]) + b'\n')
+
+    def __iter__(self):
+        return iter(sorted(int(path.stem) for path in self.directory.glob('*.jsonl')))
+
+    def __len__(self):
+        return len(list(self.directory.glob('*.jsonl')))
+
+    def __getitem__(self, year):
+        path = self.directory / f'{year}.jsonl'
+        if not path.exists():
+            raise KeyError(year)
+        with open(path, 'rb') as f:
+            countries = dict(json_backend.loads(line) for line in f)
+        return snapshot_documents(self.metadata, self.country_lookup, {int(year): countries})[int(year)]
+
+
+def merge_owid(country, years_data):
+    """Merge one country's OWID years into its entry; returns (merged years, added years)."""
+    merged_count = 0
+    new_year_count = 0
+    for year_str, owid_entry in years_data.items():
+        if year_str in country['years']:
+            # Merge into existing year
+            if 'production' in owid_entry:
+                country['years'][year_str]['production'] = owid_entry['production']
+            if 'consumption' in owid_entry:
+                country['years'][year_str]['consumption'] = owid_entry['consumption']
+            merged_count += 1
+        else:
+            # Add new year entry with just OWID data
+            country['years'][year_str] = owid_entry
+            new_year_count += 1
+    return merged_count, new_year_count
+
+
+def update_metadata(metadata, all_years, generated):
+    metadata['generated'] = generated
+    metadata['sources'] = [
+        'Eurostat energy trade (estat_nrg_ti_*, estat_nrg_te_*)',
+        'Eurostat import dependency (estat_nrg_ind_id, estat_nrg_ind_id3cf)',
+        'Our World in Data - Energy Dataset (production, consumption)'
+    ]
+    metadata['production_consumption_unit'] = 'TWh'
+    metadata['production_types'] = list(OWID_PRODUCTION_COLS.values())
+    metadata['consumption_types'] = list(OWID_CONSUMPTION_COLS.values())
+    if all_years:
+        metadata['time_range'] = [min(all_years), max(all_years)]
+
+
+def print_verification(countries):
+    for geo in SAMPLE_COUNTRIES:
+        if geo not in countries:
+            print(f'  {geo}: NOT IN DATASET')
+            continue
+        country = countries[geo]
+        for year in SAMPLE_YEARS:
+            if year not in country['years']:
+                print(f'  {geo}/{year}: no data')
+                continue
+            yd = country['years'][year]
+            prod = yd.get('production', {})
+            cons = yd.get('consumption', {})
+            dep = yd.get('dependency', {}).get('overall')
+            print(f'  {geo}/{year}: dep={dep}%, prod={list(prod.keys())}, cons={list(cons.keys())}')
+
+
+def save_year_snapshots(snapshots, args):
+    paths = write_year_snapshots(snapshots, OUTPUT_SHARDS, compact=not args.pretty, precision=args.float_precision)
+    publish_sharded(paths, OUTPUT_SHARDS.parent, PUBLIC_JSON.parent)
+    _, largest_size, total_size = sharded_size(paths)
+    print(f'  Year snapshots: {OUTPUT_SHARDS / "by_year"} ({len(paths)} years, '
+          f'largest {largest_size / 1024:.1f} KB, total {total_size / (1024 * 1024):.2f} MB)')
+
+
+def augment_streamed(owid_lookup, args):
+    """Steps 5-8 for --stream: merge and write each country as it is read from the input."""
+    print('Step 5-8: Streaming merge into energy_mix.json...')
+    t0 = time.time()
+    generated = datetime.now().isoformat()
+    members = {}
+    stats = {'countries': 0, 'merged': 0, 'added': 0}
+    all_years_set = set()
+    samples = {}
+    parts_dir = tempfile.TemporaryDirectory(prefix='energy_mix_by_year_')
+    snapshots = SpooledSnapshots(parts_dir.name)
+
+    def countries():
+        # NaN values decode as None
+        for key, value in json_backend.iter_members(INPUT_JSON, nested=['countries']):
+            if not isinstance(key, tuple):
+                members[key] = value
+                continue
+            geo, country = key[1], value
+            if geo in owid_lookup:
+                merged, added = merge_owid(country, owid_lookup[geo])
+                stats['merged'] += merged
+                stats['added'] += added
+            stats['countries'] += 1
+            all_years_set.update(int(y) for y in country['years'])
+            if geo in SAMPLE_COUNTRIES:
+                samples[geo] = country
+            snapshots.add(geo, country)
+            yield geo, country
+
+    def tail():
+        update_metadata(members['metadata'], all_years_set, generated)
+        return members
+
+    sizes = write_json_stream(OUTPUT_JSON, {}, 'countries', countries(), tail, precision=args.float_precision,
+                              generated=generated)
+    print(f'  Streamed {stats["countries"]} countries in {time.time()-t0:.1f}s')
+    print(f'  Merged into {stats["merged"]:,} existing year entries')
+    print(f'  Added {stats["added"]:,} new year entries (OWID-only)')
+    print(f'  Time range: {members["metadata"].get("time_range")}')
+    print()
+
+    print('  Verification:')
+    print_verification(samples)
+    print()
+
+    print(f'  Saved to: {OUTPUT_JSON}')
+    print(f'  File size: {format_sizes(sizes)}')
+    print(f'  Copied to: {publish(OUTPUT_JSON, PUBLIC_JSON.parent, sizes)}')
+    snapshots.metadata = members['metadata']
+    snapshots.country_lookup = members.get('country_lookup', {})
+    with parts_dir:
+        save_year_snapshots(snapshots, args)
+    print(f'  Write time: {time.time()-t0:.1f}s')
+    print()
+
+
+def augment_loaded(data, owid_lookup, args):
+    """Steps 5-8 on the fully loaded dataset."""
+    # ---- Step 5: Merge into existing JSON ----
+    print('Step 5: Merging OWID data into existing dataset...')
+    merged_count = 0
+    new_year_count = 0
+
+    for geo, years_data in owid_lookup.items():
+        if geo not in data['countries']:
+            # Country exists in OWID but not in Eurostat dataset — skip
+            continue
+        merged, added = merge_owid(data['countries'][geo], years_data)
+        merged_count += merged
+        new_year_count += added
+
+    print(f'  Merged into {merged_count:,} existing year entries')
+    print(f'  Added {new_year_count:,} new year entries (OWID-only)')
+    print()
+
+    # ---- Step 6: Update metadata ----
+    print('Step 6: Updating metadata...')
+    all_years_set = set()
+    for country in data['countries'].values():
+        all_years_set.update(int(y) for y in country['years'].keys())
+    update_metadata(data['metadata'], all_years_set, datetime.now().isoformat())
+    print(f'  Time range: {data["metadata"]["time_range"]}')
+    print()
+
+    # ---- Step 7: Verification ----
+    print('Step 7: Verification...')
+    print_verification(data['countries'])
+    print()
+
+    # ---- Step 8: Save ----
+    print('Step 8: Saving output...')
+    t0 = time.time()
+
+    sizes = write_json(data, OUTPUT_JSON, compact=not args.pretty, precision=args.float_precision)
+    print(f'  Saved to: {OUTPUT_JSON}')
+    print(f'  File size: {format_sizes(sizes)}')
+
+    # Copy to public/data (with the compressed siblings)
+    print(f'  Copied to: {publish(OUTPUT_JSON, PUBLIC_JSON.parent, sizes)}')
+
+    if args.sharded:
+        paths = write_sharded(data, OUTPUT_SHARDS, compact=not args.pretty, precision=args.float_precision)
+        publish_sharded(paths, OUTPUT_SHARDS.parent, PUBLIC_JSON.parent)
+        changed = sum(not sizes['skipped'] for sizes in paths.values())
+        print(f'  Sharded output: {OUTPUT_SHARDS} ({len(paths) - 1} country files, {changed} changed), '
+              f'published to {PUBLIC_JSON.parent / OUTPUT_SHARDS.name}')
+        index_size, largest_size, _ = sharded_size(paths)
+        print(f'  index.json: {index_size / 1024:.1f} KB, largest country file: {largest_size / 1024:.1f} KB')
+
+    save_year_snapshots(build_year_snapshots(data), args)
+    print(f'  Write time: {time.time()-t0:.1f}s')
+    print()
+
 
 def main():
+    args = parse_args()
     overall_start = time.time()
 
     print('=' * 60)
@@ -57,19 +325,20 @@ def main():
 
     # ---- Step 1: Load existing JSON ----
     print('Step 1: Loading existing JSON dataset...')
-    with open(INPUT_JSON, 'r', encoding='utf-8') as f:
-        text = f.read()
-    # Handle NaN values
-    text = text.replace(': NaN', ': null')
-    data = json.loads(text)
-    n_countries = len(data['countries'])
-    print(f'  Loaded {n_countries} countries')
+    if args.stream:
+        data = None
+        print(f'  Streaming {INPUT_JSON.name} one country at a time (after the OWID lookup is built)')
+    else:
+        t0 = time.time()
+        # NaN values decode as None
+        data = json_backend.load(INPUT_JSON)
+        n_countries = len(data['countries'])
+        print(f'  Loaded {n_countries} countries in {time.time()-t0:.1f}s ({json_backend.BACKEND})')
     print()
 
     # ---- Step 2: Load country code mastersheet ----
     print('Step 2: Loading country code mastersheet...')
-    with open(MASTERSHEET, 'r', encoding='utf-8') as f:
-        mastersheet = json.load(f)
+    mastersheet = json_backend.load(MASTERSHEET)
     owid_to_eurostat = mastersheet['owid_to_eurostat']
     eurostat_to_owid = mastersheet['eurostat_to_owid']
     print(f'  {len(owid_to_eurostat)} OWID→Eurostat mappings')
@@ -78,7 +347,7 @@ def main():
     # ---- Step 3: Load OWID data ----
     print('Step 3: Loading OWID energy dataset...')
     t0 = time.time()
-    df = pd.read_excel(OWID_FILE)
+    df = load_owid(OWID_FILE, list(OWID_PRODUCTION_COLS) + list(OWID_CONSUMPTION_COLS))
     print(f'  Loaded {len(df):,} rows, {len(df.columns)} columns in {time.time()-t0:.1f}s')
 
     # Filter to countries in mastersheet
@@ -106,36 +375,8 @@ def main():
         print(f'  WARNING: Missing OWID columns: {missing_cols}')
 
     # Build: {geo: {year_str: {production: {...}, consumption: {...}}}}
-    owid_lookup = {}
-    for _, row in df_filtered.iterrows():
-        geo = row['geo']
-        year_str = str(int(row['year']))
-
-        if geo not in owid_lookup:
-            owid_lookup[geo] = {}
-
-        prod = {}
-        cons = {}
-
-        for owid_col, energy_type in OWID_PRODUCTION_COLS.items():
-            if owid_col in df_filtered.columns:
-                val = row[owid_col]
-                if pd.notna(val):
-                    prod[energy_type] = round(float(val), 3)
-
-        for owid_col, energy_type in OWID_CONSUMPTION_COLS.items():
-            if owid_col in df_filtered.columns:
-                val = row[owid_col]
-                if pd.notna(val):
-                    cons[energy_type] = round(float(val), 3)
-
-        entry = {}
-        if prod:
-            entry['production'] = prod
-        if cons:
-            entry['consumption'] = cons
-        if entry:
-            owid_lookup[geo][year_str] = entry
+    owid_lookup = owid_production_consumption(df_filtered, owid_to_eurostat, OWID_PRODUCTION_COLS,
+                                              OWID_CONSUMPTION_COLS, year_key=str)
 
     print(f'  Built lookup for {len(owid_lookup)} countries in {time.time()-t0:.1f}s')
 
@@ -144,94 +385,10 @@ def main():
     print(f'  Total year entries: {total_year_entries:,}')
     print()
 
-    # ---- Step 5: Merge into existing JSON ----
-    print('Step 5: Merging OWID data into existing dataset...')
-    merged_count = 0
-    new_year_count = 0
-
-    for geo, years_data in owid_lookup.items():
-        if geo not in data['countries']:
-            # Country exists in OWID but not in Eurostat dataset — skip
-            continue
-
-        country = data['countries'][geo]
-
-        for year_str, owid_entry in years_data.items():
-            if year_str in country['years']:
-                # Merge into existing year
-                if 'production' in owid_entry:
-                    country['years'][year_str]['production'] = owid_entry['production']
-                if 'consumption' in owid_entry:
-                    country['years'][year_str]['consumption'] = owid_entry['consumption']
-                merged_count += 1
-            else:
-                # Add new year entry with just OWID data
-                country['years'][year_str] = owid_entry
-                new_year_count += 1
-
-    print(f'  Merged into {merged_count:,} existing year entries')
-    print(f'  Added {new_year_count:,} new year entries (OWID-only)')
-    print()
-
-    # ---- Step 6: Update metadata ----
-    print('Step 6: Updating metadata...')
-    data['metadata']['generated'] = datetime.now().isoformat()
-    data['metadata']['sources'] = [
-        'Eurostat energy trade (estat_nrg_ti_*, estat_nrg_te_*)',
-        'Eurostat import dependency (estat_nrg_ind_id, estat_nrg_ind_id3cf)',
-        'Our World in Data - Energy Dataset (production, consumption)'
-    ]
-    data['metadata']['production_consumption_unit'] = 'TWh'
-    data['metadata']['production_types'] = list(OWID_PRODUCTION_COLS.values())
-    data['metadata']['consumption_types'] = list(OWID_CONSUMPTION_COLS.values())
-
-    # Update time range
-    all_years_set = set()
-    for country in data['countries'].values():
-        all_years_set.update(int(y) for y in country['years'].keys())
-    if all_years_set:
-        data['metadata']['time_range'] = [min(all_years_set), max(all_years_set)]
-    print(f'  Time range: {data["metadata"]["time_range"]}')
-    print()
-
-    # ---- Step 7: Verification ----
-    print('Step 7: Verification...')
-    sample_countries = ['DE', 'FR', 'IT', 'PL', 'ES']
-    sample_years = ['2000', '2015', '2023']
-
-    for geo in sample_countries:
-        if geo not in data['countries']:
-            print(f'  {geo}: NOT IN DATASET')
-            continue
-        country = data['countries'][geo]
-        for year in sample_years:
-            if year not in country['years']:
-                print(f'  {geo}/{year}: no data')
-                continue
-            yd = country['years'][year]
-            prod = yd.get('production', {})
-            cons = yd.get('consumption', {})
-            dep = yd.get('dependency', {}).get('overall')
-            print(f'  {geo}/{year}: dep={dep}%, prod={list(prod.keys())}, cons={list(cons.keys())}')
-
-    print()
-
-    # ---- Step 8: Save ----
-    print('Step 8: Saving output...')
-    t0 = time.time()
-
-    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False)
-
-    file_size = OUTPUT_JSON.stat().st_size / (1024 * 1024)
-    print(f'  Saved to: {OUTPUT_JSON}')
-    print(f'  File size: {file_size:.1f} MB')
-
-    # Copy to public/data
-    shutil.copy2(OUTPUT_JSON, PUBLIC_JSON)
-    print(f'  Copied to: {PUBLIC_JSON}')
-    print(f'  Write time: {time.time()-t0:.1f}s')
-    print()
+    if args.stream:
+        augment_streamed(owid_lookup, args)
+    else:
+        augment_loaded(data, owid_lookup, args)
 
     # ---- Done ----
     total_time = time.time() - overall_start
@@ -0,0 +1,554 @@
+"""
+Benchmarks for the data processing scripts.
+
+Each benchmark runs the previous (row-by-row) implementation next to the
+current one on the real input files and reports throughput, so changes to
+the processing pipeline can be compared before/after.
+
+Usage:
+    python benchmark.py trade [--rows N] [--chunk-size N]
+    python benchmark.py trade-workers [--workers 1 2 4 8] [--input-format auto|csv|parquet]
+    python benchmark.py shares [--input-format auto|csv|parquet]
+    python benchmark.py json [--files path ...] [--repeat N]
+    python benchmark.py dependency [--input-format auto|csv|parquet]
+    python benchmark.py consumption
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import create_consumptions_by_sector_json as consumption
+import create_imports_exports_json as energy_mix
+import json_backend
+from trade_cube import TradeCube
+
+
+# ============================================================================
+# Reference Implementations (previous row-by-row versions)
+# ============================================================================
+
+def legacy_reduce_trade_chunk(chunk, imports_by_partner, imports_totals, exports_by_partner, exports_totals):
+    """Original iterrows() accumulation from process_trade_data."""
+    chunk = chunk[~chunk['geo'].isin(['EU27_2020', 'EA20'])]
+    chunk = chunk[~chunk['partner'].isin(['TOTAL', 'THRD', 'NSP'])]
+    chunk = chunk[chunk['value'].notna()]
+
+    imports_chunk = chunk[chunk['flow'] == 'IMPORT']
+    for _, row in imports_chunk.iterrows():
+        geo = row['geo']
+        year = int(row['year'])
+        energy_type = row['energy_type']
+        partner = row['partner']
+        value = float(row['value'])
+
+        imports_by_partner[geo][year][energy_type][partner] += value
+        imports_totals[geo][year][energy_type] += value
+
+    exports_chunk = chunk[chunk['flow'] == 'EXPORT']
+    for _, row in exports_chunk.iterrows():
+        geo = row['geo']
+        year = int(row['year'])
+        energy_type = row['energy_type']
+        partner = row['partner']
+        value = float(row['value'])
+
+        exports_by_partner[geo][year][energy_type][partner] += value
+        exports_totals[geo][year][energy_type] += value
+
+
+def legacy_flow_shares(energy_types, totals):
+    """Original per-partner share loop from calculate_shares_and_rankings, for one flow of one geo-year."""
+    flow_data = {}
+    total_by_type = {}
+    all_partners = defaultdict(float)
+
+    for energy_type, partners in energy_types.items():
+        type_total = totals.get(energy_type, 0)
+        total_by_type[energy_type] = {
+            'value': round(type_total, 2),
+            'unit': energy_mix.ENERGY_TYPE_UNITS.get(energy_type, 'UNKNOWN')
+        }
+        for partner, value in partners.items():
+            all_partners[partner] += value
+
+    flow_data['total_by_type'] = total_by_type
+
+    partners_by_type = {}
+    for energy_type, partners in energy_types.items():
+        type_total = totals.get(energy_type, 0)
+        if type_total > 0:
+            type_partners = []
+            for partner, value in partners.items():
+                share = (value / type_total) * 100
+                if share > 0:
+                    type_partners.append({
+                        'geo': partner,
+                        'name': energy_mix.COUNTRY_NAMES.get(partner, partner),
+                        'value': round(value, 2),
+                        'share_pct': round(share, 2)
+                    })
+            type_partners.sort(key=lambda x: x['share_pct'], reverse=True)
+            if type_partners:
+                partners_by_type[energy_type] = type_partners
+
+    if partners_by_type:
+        flow_data['partners_by_type'] = partners_by_type
+
+    grand_total = sum(all_partners.values())
+    if grand_total > 0:
+        partner_shares = [{
+            'geo': partner,
+            'name': energy_mix.COUNTRY_NAMES.get(partner, partner),
+            'share_pct': round((value / grand_total) * 100, 2)
+        } for partner, value in all_partners.items()]
+        partner_shares.sort(key=lambda x: x['share_pct'], reverse=True)
+        flow_data['partners'] = [p for p in partner_shares if p['share_pct'] > 0]
+
+    return flow_data
+
+
+def legacy_calculate_shares_and_rankings(trade_data):
+    """Original nested-dict loop over every geo/year/energy_type/partner."""
+    results = {}
+    for geo, years_data in trade_data['imports_by_partner'].items():
+        for year, energy_types in years_data.items():
+            year_data = {'imports': legacy_flow_shares(energy_types, trade_data['imports_totals'][geo][year]),
+                         'exports': {}}
+            exports = trade_data['exports_by_partner'].get(geo, {}).get(year)
+            if exports:
+                year_data['exports'] = legacy_flow_shares(exports, trade_data['exports_totals'][geo][year])
+            results.setdefault(geo, {})[year] = year_data
+    return results
+
+
+def legacy_dependency_lookup(df):
+    """Original iterrows() loops over the ID/TOTAL and ID3CF/THRD subsets from load_dependency_data."""
+    dependency_data = defaultdict(lambda: defaultdict(dict))
+    subsets = [(df[(df['indicator'] == 'ID') & (df['partner'] == 'TOTAL')], 'overall'),
+               (df[(df['indicator'] == 'ID3CF') & (df['partner'] == 'THRD')], 'third_countries')]
+    for subset, metric in subsets:
+        for _, row in subset.iterrows():
+            geo = row['geo']
+            year = int(row['year'])
+            siec = row['siec']
+            value = row['value'] if pd.notna(row['value']) else None
+
+            if siec in energy_mix.EXCLUDED_SIEC_CODES:
+                continue
+
+            fuel_name = energy_mix.SIEC_TO_FUEL.get(siec, siec)
+
+            if fuel_name == 'total' or siec == 'TOTAL':
+                dependency_data[geo][year][metric] = value
+            else:
+                if 'by_fuel' not in dependency_data[geo][year]:
+                    dependency_data[geo][year]['by_fuel'] = {}
+                if fuel_name not in dependency_data[geo][year]['by_fuel']:
+                    dependency_data[geo][year]['by_fuel'][fuel_name] = {}
+                dependency_data[geo][year]['by_fuel'][fuel_name][metric] = value
+    return to_plain(dependency_data)
+
+
+def legacy_gae_shares(df):
+    """Original GAE lookup and per geo/year subcategory loop from load_gae_data."""
+    gae_data = defaultdict(lambda: defaultdict(dict))
+    for _, row in df.iterrows():
+        gae_data[row['geo']][int(row['year'])][row['siec']] = row['value']
+
+    gae_shares = defaultdict(lambda: defaultdict(dict))
+    for geo in gae_data:
+        for year in gae_data[geo]:
+            values = gae_data[geo][year]
+            for subcat_siec, parent_siec in energy_mix.SUBCAT_TO_PARENT_SIEC.items():
+                parent_val = values.get(parent_siec, 0)
+                subcat_val = values.get(subcat_siec, 0)
+                if parent_val > 0:
+                    fuel_name = energy_mix.SIEC_TO_FUEL.get(subcat_siec, subcat_siec)
+                    share = round(subcat_val / parent_val * 100, 2)
+                    gae_shares[geo][year][fuel_name] = share
+    return to_plain(gae_shares)
+
+
+def legacy_consumption_meta(data):
+    """Original iterrows() set collection from get_meta_data."""
+    end_uses = {sector: set() for sector in consumption.SECTORS}
+    countries = set()
+    for _, row in data.iterrows():
+        countries.add(row['Country'].lower())
+        if row['type'] in end_uses:
+            end_uses[row['type']].add(row['End use'])
+    return end_uses, countries
+
+
+def legacy_consumption_countries(data):
+    """Original per-country filter and iterrows() year loop from build_json_output."""
+    countries = {}
+    for country in sorted(set(data['Country'].values)):
+        countries[country] = {}
+        country_data = data[data['Country'] == country]
+        for _, row in country_data.iterrows():
+            type = row['type']
+            end_use = row['End use']
+            if type not in countries[country]:
+                countries[country][type] = {}
+            for year in consumption.YEARS:
+                if year not in countries[country][type]:
+                    countries[country][type][year] = {}
+                val = None if pd.isna(row[str(year)]) or str(row[str(year)]).strip() == '..' else float(row[str(year)])
+                if end_use not in countries[country][type][year]:
+                    countries[country][type][year][end_use] = {'products': {}}
+                if val is not None:
+                    countries[country][type][year][end_use]['products'][row['Product']] = val
+    return countries
+
+
+# ============================================================================
+# Helpers
+# ============================================================================
+
+def nested_defaultdict(depth):
+    if depth == 1:
+        return defaultdict(float)
+    return defaultdict(lambda: nested_defaultdict(depth - 1))
+
+
+def to_plain(d):
+    """Recursively convert defaultdicts into plain dicts for comparison."""
+    if isinstance(d, dict):
+        return {k: to_plain(v) for k, v in d.items()}
+    return d
+
+
+def max_abs_diff(a, b, path=()):
+    """Return (max difference, first mismatching key path) between two nested dicts."""
+    if isinstance(a, dict) or isinstance(b, dict):
+        if not isinstance(a, dict) or not isinstance(b, dict) or a.keys() != b.keys():
+            return float('inf'), path
+        worst = (0.0, None)
+        for key in a:
+            diff = max_abs_diff(a[key], b[key], path + (key,))
+            if diff[0] > worst[0]:
+                worst = diff
+        return worst
+    return abs(a - b), path
+
+
+def comparable_shares(results):
+    """Key partner lists by partner code and drop labels, so share results can go through max_abs_diff."""
+    comparable = {}
+    for geo, years in results.items():
+        for year, flows in years.items():
+            for flow, data in flows.items():
+                entry = comparable.setdefault((geo, year, flow), {})
+                for energy_type, total in data.get('total_by_type', {}).items():
+                    entry[('total', energy_type)] = total['value']
+                for energy_type, partners in data.get('partners_by_type', {}).items():
+                    for p in partners:
+                        entry[(energy_type, p['geo'], 'value')] = p['value']
+                        entry[(energy_type, p['geo'], 'share_pct')] = p['share_pct']
+                for p in data.get('partners', []):
+                    entry[('all', p['geo'])] = p['share_pct']
+    return comparable
+
+
+def partner_orders(results):
+    """Ordered partner codes of every list, keyed by (geo, year, flow, energy type or 'all')."""
+    orders = {}
+    for geo, years in results.items():
+        for year, flows in years.items():
+            for flow, data in flows.items():
+                for energy_type, partners in data.get('partners_by_type', {}).items():
+                    orders[(geo, year, flow, energy_type)] = [p['geo'] for p in partners]
+                if 'partners' in data:
+                    orders[(geo, year, flow, 'all')] = [p['geo'] for p in data['partners']]
+    return orders
+
+
+def report(label, rows, seconds, unit='rows'):
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f'  {label:<12} {seconds:8.2f}s  {rate:14,.0f} {unit}/s')
+    return rate
+
+
+# ============================================================================
+# Benchmarks
+# ============================================================================
+
+def benchmark_trade(rows, chunk_size):
+    """Compare iterrows() accumulation with grouped chunk reduction."""
+    print('=' * 60)
+    print('Benchmark: trade aggregation (Phase 2)')
+    print('=' * 60)
+    print(f'  Input: {energy_mix.TRADE_FILE}')
+    print(f'  Rows: {"all" if not rows else f"{rows:,}"}, chunk size: {chunk_size:,}')
+    print()
+
+    def read_chunks(**kwargs):
+        return pd.read_csv(energy_mix.TRADE_FILE, chunksize=chunk_size, nrows=rows or None, **kwargs)
+
+    # Previous implementation
+    imports_by_partner, exports_by_partner = nested_defaultdict(4), nested_defaultdict(4)
+    imports_totals, exports_totals = nested_defaultdict(3), nested_defaultdict(3)
+    n_rows = 0
+    start = time.time()
+    for chunk in read_chunks():
+        n_rows += len(chunk)
+        legacy_reduce_trade_chunk(chunk, imports_by_partner, imports_totals, exports_by_partner, exports_totals)
+    legacy_seconds = time.time() - start
+    legacy = {
+        'imports_by_partner': to_plain(imports_by_partner),
+        'exports_by_partner': to_plain(exports_by_partner),
+        'imports_totals': to_plain(imports_totals),
+        'exports_totals': to_plain(exports_totals)
+    }
+
+    # Grouped chunk reduction
+    start = time.time()
+    partials = [energy_mix.reduce_trade_chunk(chunk)
+                for chunk in read_chunks(usecols=energy_mix.TRADE_USECOLS, dtype=energy_mix.TRADE_DTYPES)]
+    current = TradeCube.from_trade_sums(energy_mix.merge_trade_partials(partials)).to_nested()
+    current_seconds = time.time() - start
+
+    print(f'  Rows processed: {n_rows:,}')
+    before = report('iterrows', n_rows, legacy_seconds)
+    after = report('grouped', n_rows, current_seconds)
+    print(f'  Speedup: {after / before:.1f}x')
+
+    for key in legacy:
+        diff, path = max_abs_diff(legacy[key], current[key])
+        status = 'OK' if diff < 1e-6 else f'MISMATCH at {path} (diff={diff})'
+        print(f'  {key}: {status}')
+
+
+def benchmark_trade_workers(worker_counts, input_format, chunk_size):
+    """Time Phase 2 on the whole trade file for several worker counts."""
+    print('=' * 60)
+    print('Benchmark: parallel trade reduction (Phase 2)')
+    print('=' * 60)
+    trade_path, trade_format = energy_mix.resolve_intermediate(energy_mix.TRADE_FILE, input_format)
+    print(f'  Input: {trade_path} ({trade_format})')
+    print()
+
+    baseline = None
+    baseline_seconds = None
+    for workers in worker_counts:
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = energy_mix.process_trade_data(chunk_size=chunk_size, input_format=input_format,
+                                                   workers=workers)
+        seconds = time.time() - start
+
+        if baseline is None:
+            baseline, baseline_seconds = result, seconds
+        same = result.shape == baseline.shape and np.array_equal(result.values, baseline.values, equal_nan=True)
+        identical = 'identical' if same else 'DIFFERENT'
+        print(f'  workers={workers:<3} {seconds:8.2f}s  speedup {baseline_seconds / seconds:5.2f}x  ({identical})')
+
+
+def benchmark_shares(input_format):
+    """Compare the nested-dict share loop with the grouped computation on the full trade cube."""
+    print('=' * 60)
+    print('Benchmark: shares and rankings (Phase 3)')
+    print('=' * 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if energy_mix.TRADE_CUBE_FILE.exists():
+            cube = TradeCube.load(energy_mix.TRADE_CUBE_FILE)
+        else:
+            cube = energy_mix.process_trade_data(input_format=input_format)
+    trade_data = cube.to_nested()
+    n_geo_years = sum(len(years) for years in trade_data['imports_by_partner'].values())
+    print(f'  Countries: {len(trade_data["imports_by_partner"])}, country-years: {n_geo_years:,}')
+    print()
+
+    start = time.time()
+    legacy = legacy_calculate_shares_and_rankings(trade_data)
+    legacy_seconds = time.time() - start
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        current = energy_mix.calculate_shares_and_rankings(cube)
+    current_seconds = time.time() - start
+
+    before = report('loops', n_geo_years, legacy_seconds, 'country-years')
+    after = report('grouped', n_geo_years, current_seconds, 'country-years')
+    print(f'  Speedup: {after / before:.1f}x')
+
+    # Totals are summed in a different order, so rounded values may differ by one cent
+    diff, path = max_abs_diff(comparable_shares(legacy), comparable_shares(current))
+    status = 'OK' if diff <= 0.0101 else f'MISMATCH at {path} (diff={diff})'
+    print(f'  Results: {status}')
+
+    # The values above are keyed by partner; also check the order of every partner list
+    legacy_orders, current_orders = partner_orders(legacy), partner_orders(current)
+    reordered = [key for key in legacy_orders if legacy_orders[key] != current_orders.get(key)]
+    missing = current_orders.keys() - legacy_orders.keys()
+    if reordered or missing:
+        first = reordered[0] if reordered else next(iter(missing))
+        print(f'  Partner order: MISMATCH in {len(reordered) + len(missing):,} of {len(legacy_orders):,} lists '
+              f'(first at {first})')
+    else:
+        print(f'  Partner order: OK ({len(legacy_orders):,} lists)')
+
+
+def benchmark_json(files, repeat):
+    """Encode/decode time of each prepared JSON file with every installed JSON backend."""
+    print('=' * 60)
+    print('Benchmark: JSON backends')
+    print('=' * 60)
+    print(f'  Installed backends: {", ".join(sorted(json_backend.BACKENDS))} '
+          f'(default: {json_backend.BACKEND}), best of {repeat}')
+
+    def best_time(func, arg):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(arg)
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    for path in files:
+        raw = Path(path).read_bytes()
+        print()
+        print(f'  {Path(path).name} ({len(raw) / (1024 * 1024):.2f} MB)')
+        reference = None
+        for name in json_backend.PREFERENCE:
+            if name not in json_backend.BACKENDS:
+                continue
+            dumps, loads = json_backend.BACKENDS[name]
+            decode_seconds, data = best_time(loads, raw)
+            encode_seconds, encoded = best_time(dumps, data)
+            if reference is None:
+                reference = data
+            same = 'same data' if loads(encoded) == reference else 'DIFFERENT'
+            print(f'    {name:<8} decode {decode_seconds * 1000:8.1f} ms  '
+                  f'encode {encode_seconds * 1000:8.1f} ms  ({len(encoded) / (1024 * 1024):.2f} MB, {same})')
+
+
+def benchmark_dependency(input_format):
+    """Compare the iterrows() dependency and GAE loaders with the vectorized builders on the full files."""
+    print('=' * 60)
+    print('Benchmark: dependency and GAE share loaders (Phase 1)')
+    print('=' * 60)
+    dependency_path, dependency_format = energy_mix.resolve_intermediate(energy_mix.DEPENDENCY_FILE, input_format)
+    if dependency_format == 'parquet':
+        dependency = pd.read_parquet(dependency_path, columns=energy_mix.DEPENDENCY_COLUMNS)
+    else:
+        dependency = pd.read_csv(dependency_path, usecols=energy_mix.DEPENDENCY_COLUMNS)
+    inputs = [('dependency', dependency_path, dependency, legacy_dependency_lookup,
+               energy_mix.build_dependency_lookup)]
+    if energy_mix.GAE_FILE.exists():
+        inputs.append(('gae', energy_mix.GAE_FILE, pd.read_csv(energy_mix.GAE_FILE), legacy_gae_shares,
+                       energy_mix.gae_subcategory_shares))
+    else:
+        print(f'  GAE file not found, skipped: {energy_mix.GAE_FILE}')
+
+    for name, path, df, legacy_func, current_func in inputs:
+        print()
+        print(f'  {name}: {path} ({len(df):,} rows)')
+        start = time.time()
+        legacy = legacy_func(df)
+        legacy_seconds = time.time() - start
+
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            current = current_func(df)
+        current_seconds = time.time() - start
+
+        before = report('iterrows', len(df), legacy_seconds)
+        after = report('vectorized', len(df), current_seconds)
+        print(f'  Speedup: {after / before:.1f}x')
+        # Compare the encoded dicts so key order and NaN values count too
+        same = json.dumps(legacy) == json.dumps(current)
+        print(f'  Results: {"identical" if same else "DIFFERENT"}')
+
+
+def benchmark_consumption():
+    """Compare the iterrows() consumption builder with the melt-based one on the four IEA end-use files."""
+    print('=' * 60)
+    print('Benchmark: consumption by sector meta data and JSON build')
+    print('=' * 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = consumption.load_data()
+    print(f'  {len(data):,} rows x {len(consumption.YEARS)} years')
+
+    start = time.time()
+    legacy_meta = legacy_consumption_meta(data)
+    legacy = legacy_consumption_countries(data)
+    legacy_seconds = time.time() - start
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        meta_data = consumption.get_meta_data(data)
+        current = consumption.build_json_output(data, meta_data)
+    current_seconds = time.time() - start
+
+    before = report('iterrows', len(data), legacy_seconds)
+    after = report('melt', len(data), current_seconds)
+    print(f'  Speedup: {after / before:.1f}x')
+    end_uses, countries = legacy_meta
+    same_meta = ([end_uses[sector] for sector in consumption.SECTORS] ==
+                 [meta_data['industry_end_uses'], meta_data['residential_end_uses'],
+                  meta_data['transport_end_uses'], meta_data['service_end_uses']] and
+                 {country.lower() for country in meta_data['country_codes'].values()} <= countries)
+    # Compare the encoded dicts so key order counts too
+    same = same_meta and json.dumps(legacy) == json.dumps(current['countries'])
+    print(f'  Results: {"identical" if same else "DIFFERENT"}')
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark data processing steps.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    trade = subparsers.add_parser('trade', help='Phase 2 trade aggregation throughput')
+    trade.add_argument('--rows', type=int, default=2_000_000,
+                       help='Number of trade rows to read (0 = whole file)')
+    trade.add_argument('--chunk-size', type=int, default=500_000)
+
+    trade_workers = subparsers.add_parser('trade-workers', help='Phase 2 wall-clock time per worker count')
+    trade_workers.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    trade_workers.add_argument('--input-format', choices=['auto', 'csv', 'parquet'], default='auto')
+    trade_workers.add_argument('--chunk-size', type=int, default=500_000)
+
+    shares = subparsers.add_parser('shares', help='Phase 3 share and ranking computation')
+    shares.add_argument('--input-format', choices=['auto', 'csv', 'parquet'], default='auto')
+
+    json_files = subparsers.add_parser('json', help='JSON encode/decode time per backend')
+    json_files.add_argument('--files', nargs='+', default=sorted(energy_mix.OUTPUT_PATH.glob('*.json')),
+                            help='JSON files to round-trip (default: prepared-sets/*.json)')
+    json_files.add_argument('--repeat', type=int, default=3)
+
+    dependency = subparsers.add_parser('dependency', help='Phase 1 dependency lookup and GAE shares')
+    dependency.add_argument('--input-format', choices=['auto', 'csv', 'parquet'], default='auto')
+
+    subparsers.add_parser('consumption', help='Consumption by sector meta data and JSON build')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'trade':
+        benchmark_trade(args.rows, args.chunk_size)
+    elif args.benchmark == 'trade-workers':
+        benchmark_trade_workers(args.workers, args.input_format, args.chunk_size)
+    elif args.benchmark == 'shares':
+        benchmark_shares(args.input_format)
+    elif args.benchmark == 'json':
+        benchmark_json(args.files, args.repeat)
+    elif args.benchmark == 'dependency':
+        benchmark_dependency(args.input_format)
+    elif args.benchmark == 'consumption':
+        benchmark_consumption()
+
+
+if __name__ == '__main__':
+    main()
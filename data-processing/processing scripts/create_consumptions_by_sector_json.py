@@ -9,17 +9,28 @@ Input files:
 1283 + 856 + 917 - 6 = 3050 rows total
 
 Output:
-- energy_consumptions_by_sector.json
+- energy_consumptions_by_sector.json (per-country data plus 'rollups': the
+  sunburst and pie chart data of every country-year, see consumption_rollups())
+
+By default every end use of a country's sector appears under every year, with
+empty products where the IEA has no value. --sparse leaves out empty end uses,
+years, sectors and countries and lists each sector's end uses once in
+metadata.end_uses instead:
+
+    python create_consumptions_by_sector_json.py --sparse
 """
 
+import argparse
 import pandas as pd
 import numpy as np
-import json
 import time
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
 
+import json_backend
+from output_writer import write_json, publish, format_sizes
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -29,6 +40,7 @@ BASE_PATH = Path(__file__).parent.parent / 'raw-data' / 'end_uses_efficiency'
 # Estimated row counts for progress calculation (update if data changes)
 ESTIMATED_TRADE_ROWS = 4_461
 OUTPUT_PATH = Path(__file__).parent.parent / 'prepared-sets'
+PUBLIC_PATH = Path(__file__).parent.parent.parent / 'public' / 'data'
 
 ENERGY_FILE = BASE_PATH / 'industry_energy.csv'
 RESIDENTIAL_FILE = BASE_PATH / 'residential_energy.csv'
@@ -79,6 +91,19 @@ ROWS = [
     '2022', 
     '2023'
 ]
+YEARS = ROWS[3:]
+SECTORS = ['Industry', 'Residential', 'Transport', 'Service']
+
+# Rollups: the end use holding each sector's total (matched as a substring, like the web app did)
+# and the end uses that become sunburst children
+SECTOR_TOTAL_END_USES = {
+    'Industry': 'Manufacturing',
+    'Residential': 'Total residential',
+    'Transport': 'Total passenger and freight transport',
+    'Service': 'Total services',
+}
+TOTAL_PRODUCT = 'Total final use (PJ)'
+TRANSPORT_TOTAL_CHILDREN = ['Total trains', 'Total airplanes', 'Total ships']
 
 # ============================================================================
 # Progress Tracking Utilities
@@ -172,25 +197,13 @@ def load_data():
 def get_meta_data(data):
     print_phase_header(2, 'Calculating meta data')
 
-    # Example: Calculate unique end uses per sector
-    industry_end_uses = set()
-    residential_end_uses = set()
-    transport_end_uses = set()
-    services_end_uses = set()
-    countries = set()
-
-    for _, row in data.iterrows():
-        type = row['type']
-        enduse = row['End use']
-        countries.add(row['Country'].lower())
-        if 'Industry' == type:
-            industry_end_uses.add(enduse)
-        elif 'Residential' == type:
-            residential_end_uses.add(enduse)
-        elif 'Transport' == type:
-            transport_end_uses.add(enduse)
-        elif 'Service' == type:
-            services_end_uses.add(enduse)
+    # Unique end uses per sector, collected in row order
+    end_uses = {sector: set(data.loc[data['type'] == sector, 'End use'].tolist()) for sector in SECTORS}
+    industry_end_uses = end_uses['Industry']
+    residential_end_uses = end_uses['Residential']
+    transport_end_uses = end_uses['Transport']
+    services_end_uses = end_uses['Service']
+    countries = set(data['Country'].str.lower().tolist())
 
     country_codes = {
         code: country
@@ -220,32 +233,114 @@ def get_meta_data(data):
 # Phase 3: Build JSON Structure
 # ============================================================================
 
+def product_values(data):
+    """Melt the year columns to (Country, type, End use, Product, year, value) rows with a value.
+
+    NaN and '..' (not available) cells are dropped; rows are sorted by source
+    row, then year, so products keep the order of the CSV rows.
+    """
+    long = (data.assign(row=np.arange(len(data)))
+            .melt(id_vars=['row', 'Country', 'type', 'End use', 'Product'], value_vars=YEARS,
+                  var_name='year', value_name='value'))
+    long = long[long['value'].notna() & (long['value'].astype(str).str.strip() != '..')]
+    long = long.assign(value=long['value'].astype('float64'))
+    return long.sort_values('row', kind='stable')
+
+
+def is_sunburst_child(sector, end_use):
+    """Whether an end use is a child of its sector in the sunburst (subtotals and the sector total are not)."""
+    if sector == 'Industry':
+        return True
+    if sector == 'Transport':
+        return 'Total' not in end_use or end_use in TRANSPORT_TOTAL_CHILDREN
+    return 'Total residential' not in end_use and 'Total services' not in end_use
+
+
+def product_key(product):
+    """Canonical product name for the pie chart: 'Electricity (PJ)' -> 'Electricity'."""
+    return product.replace('(PJ)', '', 1).strip()
+
+
+def consumption_rollups(countries):
+    """{country: {year: {'sunburst': [...], 'pie': {sector: [...]}}}} ready for the charts.
+
+    sunburst: sectors with a positive total, each {'name', 'value', 'children'},
+    children being the end uses with a positive 'Total final use (PJ)'. The
+    total is the sum of the children, or the sector total end use if they are
+    all zero.
+    pie: per sector of the country, the non-total products of its total end
+    use as [{'name', 'value'}].
+    End use and product names are classified once, not per country-year.
+    Country-years with nothing to show are left out.
+    """
+    end_uses = {(sector, end_use) for sectors in countries.values() for sector, years in sectors.items()
+                for year_data in years.values() for end_use in year_data}
+    children = {key for key in end_uses if is_sunburst_child(*key)}
+    totals = {key for key in end_uses if SECTOR_TOTAL_END_USES[key[0]] in key[1]}
+    products = {product for sectors in countries.values() for years in sectors.values()
+                for year_data in years.values() for data in year_data.values() for product in data['products']}
+    pie_products = {product: product_key(product) for product in products if 'Total' not in product}
+
+    rollups = {}
+    for country, sectors in countries.items():
+        for year in YEARS:
+            sunburst = []
+            pie = {}
+            for sector in SECTORS:
+                year_data = sectors.get(sector, {}).get(year)
+                if year_data is None:
+                    continue
+                sector_children = []
+                sector_total = 0
+                fallback = 0
+                pie_values = {}
+                for end_use, data in year_data.items():
+                    value = data['products'].get(TOTAL_PRODUCT) or 0
+                    if (sector, end_use) in children:
+                        if value > 0:
+                            sector_children.append({'name': end_use, 'value': value})
+                        sector_total += value
+                    if (sector, end_use) in totals:
+                        fallback += value
+                        for product, product_value in data['products'].items():
+                            if product in pie_products:
+                                pie_values[pie_products[product]] = product_value or 0
+                if sector_total == 0 and sector != 'Industry':
+                    sector_total = fallback
+                if sector_total > 0:
+                    sunburst.append({'name': sector, 'value': sector_total, 'children': sector_children})
+                pie[sector] = [{'name': name, 'value': value} for name, value in pie_values.items()]
+            if sunburst or any(pie.values()):
+                rollups.setdefault(country, {})[year] = {'sunburst': sunburst, 'pie': pie}
+    return rollups
+
+
 def build_json_output(data, meta_data):
     print_phase_header(3, 'Building JSON output')
 
     # Get all countries and years
     all_countries = sorted(set(data['Country'].values))
-    all_years = ['2000', '2005', '2010', '2015', '2016', '2017', '2018', '2019', '2020', '2021', '2022', '2023']
+    all_years = YEARS
     print(f'  Countries: {len(all_countries)}, Years: {all_years[0]}-{all_years[-1]}')
 
     # Build country data 'AU' -> {residential: {'year': {'end_use': {'product': Total final use (PJ), 'value': 59.74}}}, industry: y, transport: z}
-    countries = {}
-    for country in all_countries:
-        countries[country] = {}
-        country_data = data[data['Country'] == country]
-        for _, row in country_data.iterrows():
-            type = row['type']
-            end_use = row['End use']
-            if type not in countries[country]:
-                countries[country][type] = {}
-            for year in all_years:
-                if year not in countries[country][type]:
-                    countries[country][type][year] = {}
-                val = None if pd.isna(row[str(year)]) or str(row[str(year)]).strip() == '..' else float(row[str(year)])
-                if end_use not in countries[country][type][year]:
-                    countries[country][type][year][end_use] = {'products': {}}
-                if val is not None:
-                    countries[country][type][year][end_use]['products'][row['Product']] = val
+    # Every (country, type) gets all years, and every end use of a country's type appears in each
+    # of them (with empty products if it has no value that year), in order of first appearance
+    countries = {country: {} for country in all_countries}
+    end_uses = data[['Country', 'type', 'End use']].drop_duplicates()
+    for country, type, end_use in zip(end_uses['Country'].tolist(), end_uses['type'].tolist(),
+                                      end_uses['End use'].tolist()):
+        if type not in countries[country]:
+            countries[country][type] = {year: {} for year in all_years}
+        for year_data in countries[country][type].values():
+            year_data[end_use] = {'products': {}}
+
+    # One row per value (country, type, end use, product, year), '..' and blanks dropped, in row then year order
+    values = product_values(data)
+    for country, type, end_use, product, year, value in zip(
+            values['Country'].tolist(), values['type'].tolist(), values['End use'].tolist(),
+            values['Product'].tolist(), values['year'].tolist(), values['value'].tolist()):
+        countries[country][type][year][end_use]['products'][product] = value
 
     sorted_countries = sorted(all_countries)
     total_countries = len(sorted_countries)
@@ -263,18 +358,51 @@ def build_json_output(data, meta_data):
             'residential_end_uses': list(meta_data['residential_end_uses']),
             'transport_end_uses': list(meta_data['transport_end_uses']),
             'service_end_uses': list(meta_data['service_end_uses']),
+            'sparse': False,
         },
         'countries': countries,
+        'rollups': consumption_rollups(countries),
         'country_lookup': {k: v for k, v in meta_data['country_codes'].items() if k in meta_data['country_codes']},
     }
 
     return output
 
+
+def sparse_output(output):
+    """Copy of the output without empty end uses, years, sectors or countries.
+
+    metadata.end_uses records every sector's end uses (in order of first
+    appearance) so consumers can still list end uses without values.
+    """
+    countries = {}
+    vocabulary = {}
+    for country, sectors in output['countries'].items():
+        for type, years in sectors.items():
+            end_uses = vocabulary.setdefault(type, {})
+            for year, year_data in years.items():
+                end_uses.update(dict.fromkeys(year_data))
+                kept = {end_use: data for end_use, data in year_data.items() if data['products']}
+                if kept:
+                    countries.setdefault(country, {}).setdefault(type, {})[year] = kept
+
+    metadata = {**output['metadata'], 'sparse': True,
+                'end_uses': {type: list(end_uses) for type, end_uses in vocabulary.items()}}
+    return {**output, 'metadata': metadata, 'countries': countries}
+
+
 # ============================================================================
 # Main
 # ============================================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Create energy_consumptions_by_sector.json from IEA end-use data.')
+    parser.add_argument('--sparse', action='store_true',
+                        help='Leave out end uses, years and sectors without values')
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     print('=' * 60)
     print('Consumption JSON Dataset Generator')
     print('=' * 60)
@@ -289,6 +417,9 @@ def main():
 
     # Phase 3: Build JSON output
     output = build_json_output(data, meta_data)
+    if args.sparse:
+        dense_size = len(json_backend.dumps(output))
+        output = sparse_output(output)
 
     # Save output
     output_file = OUTPUT_PATH / 'energy_consumptions_by_sector.json'
@@ -299,12 +430,15 @@ def main():
     print()
 
     print('  Writing JSON file...')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-
-    file_size = output_file.stat().st_size / (1024 * 1024)
+    sizes = write_json(output, output_file)
     print(f'  Saved to: {output_file}')
-    print(f'  File size: {file_size:.2f} MB')
+    print(f'  File size: {format_sizes(sizes)}')
+    if args.sparse:
+        print(f'  Sparse: {sizes["raw"] / (1024 * 1024):.2f} MB vs {dense_size / (1024 * 1024):.2f} MB dense '
+              f'({(1 - sizes["raw"] / dense_size) * 100:.1f}% smaller)')
+
+    # Copy to public/data (with the compressed siblings)
+    print(f'  Copied to: {publish(output_file, PUBLIC_PATH, sizes)}')
 
     # Final summary
     print()
@@ -9,17 +9,26 @@ Reads:
 
 Outputs:
 - prepared-sets/eco_data.json
-- Also copies to public/data/eco_data.json
+- prepared-sets/eco_data/by_year/<year>.json (carbon intensity and per-capita emissions rankings of one year)
+- Also copies both to public/data/
+
+All values come from one (geo, year) panel joining the OWID and IEA data; the
+latest values and the rankings are read from it. With --series every country
+also gets its full per-year series:
+
+    python create_eco_data_json.py --series
 """
 
+import argparse
 import pandas as pd
-import numpy as np
-import json
 import time
-import shutil
 from pathlib import Path
 from datetime import datetime
 
+import json_backend
+from owid_loader import load_owid, owid_long, round_values
+from output_writer import write_json, publish, publish_sharded, write_year_snapshots, sharded_size, format_sizes
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -29,6 +38,7 @@ OWID_FILE = BASE_DIR / 'raw-data' / 'energy_consumption' / 'owid-energy-data.xls
 MASTERSHEET = BASE_DIR / 'country_code_mastersheet.json'
 OUTPUT_JSON = BASE_DIR / 'prepared-sets' / 'eco_data.json'
 PUBLIC_JSON = BASE_DIR.parent / 'public' / 'data' / 'eco_data.json'
+OUTPUT_SNAPSHOTS = BASE_DIR / 'prepared-sets' / 'eco_data'
 
 IEA_DIR = BASE_DIR / 'raw-data' / 'end_uses_efficiency'
 
@@ -67,25 +77,136 @@ NAME_TO_CODE = {name: code for code, name in COUNTRY_NAMES.items()}
 YEAR_COLS = ['2000.0', '2005.0', '2010.0', '2015.0', '2016.0', '2017.0',
              '2018.0', '2019.0', '2020.0', '2021.0', '2022.0', '2023.0']
 
+# Panel columns: OWID values, per-capita emissions (t CO2/capita) and totals (kt CO2) by sector
+OWID_COLUMNS = ['carbon_intensity_elec', 'population']
+SECTORS = ['residential', 'services', 'transport', 'industry']
+KT_COLUMNS = [f'{sector}_kt' for sector in SECTORS]
+SERIES_COLUMNS = ['carbon_intensity_elec'] + SECTORS + KT_COLUMNS
+
 
 def read_iea_csv(filepath):
     """Read an IEA CSV, skipping the 'Source:' header line."""
     return pd.read_csv(filepath, skiprows=1)
 
 
-def get_last_available(row, year_cols=YEAR_COLS):
-    """Scan year columns from right to left, return (year, value) for last non-null, non-'..' value."""
-    for col in reversed(year_cols):
-        val = row.get(col)
-        if val is not None and val != '..' and pd.notna(val):
-            try:
-                return int(float(col)), round(float(val), 4)
-            except (ValueError, TypeError):
-                continue
-    return None, None
+def year_values(df, year_cols=YEAR_COLS):
+    """Year columns as numbers, indexed by country (first row per country); '..' and blanks become NaN."""
+    df = df.drop_duplicates('Country').set_index('Country')
+    return df.reindex(columns=year_cols).apply(pd.to_numeric, errors='coerce')
+
+
+def iea_series(values):
+    """(geo, year) series of the non-missing cells of year_values(), rounded to 4 decimals."""
+    values = values[values.index.isin(NAME_TO_CODE.keys())].rename(index=NAME_TO_CODE)
+    values.columns = [int(float(col)) for col in values.columns]
+    series = values.stack().dropna()
+    series.index.names = ['geo', 'year']
+    return pd.Series(round_values(series.to_numpy(dtype='float64'), 4), index=series.index)
+
+
+def transport_percapita(df_cars, df_freight):
+    """year_values() of Cars/light trucks + Freight trucks, NaN where neither has data."""
+    cars, freight = year_values(df_cars), year_values(df_freight)
+    countries = cars.index.union(freight.index, sort=False)
+    cars, freight = cars.reindex(countries), freight.reindex(countries)
+    summed = cars.fillna(0) + freight.fillna(0)
+    return summed.where(cars.notna() | freight.notna())
+
+
+def owid_panel(df_owid, owid_to_eurostat):
+    """(geo, year) frame of carbon_intensity_elec (rounded to 2 decimals) and population for project countries."""
+    long = owid_long(df_owid, owid_to_eurostat, OWID_COLUMNS).drop_duplicates(['geo', 'year', 'column'], keep='last')
+    panel = long.pivot(index=['geo', 'year'], columns='column', values='value').reindex(columns=OWID_COLUMNS)
+    panel.columns.name = None
+    panel['carbon_intensity_elec'] = round_values(panel['carbon_intensity_elec'].to_numpy(dtype='float64'), 2)
+    return panel
+
+
+def eco_panel(owid, iea):
+    """Outer join of the OWID panel and the IEA series ({column: series}) on (geo, year).
+
+    Adds industry per capita (t CO2/capita = kt CO2 * 1000 / population) for
+    every country-year with industry emissions and a population that year.
+    """
+    panel = owid.join(pd.concat(iea, axis=1).reindex(columns=list(iea)), how='outer').sort_index()
+    panel.index.names = ['geo', 'year']
+    population = panel['population']
+    industry = (panel['industry_kt'] * 1000 / population).where(population > 0)
+    panel['industry'] = round_values(industry.to_numpy(dtype='float64'), 4)
+    return panel
+
+
+def latest(series):
+    """{geo: (year, value)} for the last year with a value of a sorted (geo, year) series."""
+    series = series.dropna()
+    series = series[~series.index.get_level_values('geo').duplicated(keep='last')]
+    return {geo: (int(year), value) for (geo, year), value in zip(series.index.tolist(), series.tolist())}
+
+
+def latest_by_sector(last, geo, suffix='', decimals=None):
+    """{'year': latest sector year, sector: value} for the sectors with a value for geo, or None."""
+    values, years = {}, []
+    for sector in SECTORS:
+        if geo in last[sector + suffix]:
+            year, value = last[sector + suffix][geo]
+            years.append(year)
+            values[sector] = value if decimals is None else round(value, decimals)
+    return {'year': max(years), **values} if values else None
+
+
+def year_rankings(values, project_countries):
+    """{year: ranking} of a (geo, year) series across project countries, lowest first."""
+    values = values.dropna()
+    values = values[values.index.get_level_values('geo').isin(project_countries.keys())]
+    order = {geo: i for i, geo in enumerate(project_countries)}
+    rankings = {}
+    for (geo, year), value in zip(values.index.tolist(), values.tolist()):
+        rankings.setdefault(int(year), []).append({
+            'code': geo,
+            'name': project_countries[geo],
+            'value': value,
+            'year': int(year)
+        })
+    for ranking in rankings.values():
+        ranking.sort(key=lambda x: (x['value'], order[x['code']]))
+    return dict(sorted(rankings.items()))
+
+
+def emissions_per_capita_totals(panel):
+    """Sum of the per-capita sectors for each (geo, year) with a positive total, rounded to 2 decimals."""
+    total = sum(panel[sector].fillna(0) for sector in SECTORS)
+    total = total[total > 0]
+    return pd.Series(round_values(total.to_numpy(dtype='float64'), 2), index=total.index)
+
+
+def panel_series(panel, geos):
+    """{geo: {year: {carbon_intensity, emissions_per_capita: {sector}, emissions_total_kt: {sector}}}}."""
+    long = panel[panel.index.get_level_values('geo').isin(geos)][SERIES_COLUMNS].stack().dropna()
+    values = long.to_numpy(dtype='float64').copy()
+    kt = long.index.get_level_values(2).str.endswith('_kt')
+    values[kt] = round_values(values[kt], 1)
+
+    series = {}
+    for (geo, year, column), value in zip(long.index.tolist(), values.tolist()):
+        year_entry = series.setdefault(geo, {}).setdefault(int(year), {})
+        if column == 'carbon_intensity_elec':
+            year_entry['carbon_intensity'] = value
+        elif column.endswith('_kt'):
+            year_entry.setdefault('emissions_total_kt', {})[column[:-len('_kt')]] = value
+        else:
+            year_entry.setdefault('emissions_per_capita', {})[column] = value
+    return series
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Create eco_data.json from OWID and IEA data.')
+    parser.add_argument('--series', action='store_true',
+                        help='Also write the per-year series of every country')
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     overall_start = time.time()
 
     print('=' * 60)
@@ -95,8 +216,7 @@ def main():
 
     # ---- Step 1: Load country code mastersheet ----
     print('Step 1: Loading country code mastersheet...')
-    with open(MASTERSHEET, 'r', encoding='utf-8') as f:
-        mastersheet = json.load(f)
+    mastersheet = json_backend.load(MASTERSHEET)
     owid_to_eurostat = mastersheet['owid_to_eurostat']
     project_countries = {c['eurostat']: c['name'] for c in mastersheet['countries']}
     print(f'  {len(project_countries)} project countries')
@@ -105,33 +225,13 @@ def main():
     # ---- Step 2: Load OWID data (carbon_intensity_elec + population) ----
     print('Step 2: Loading OWID energy dataset...')
     t0 = time.time()
-    df_owid = pd.read_excel(OWID_FILE)
+    df_owid = load_owid(OWID_FILE, ['carbon_intensity_elec', 'population'])
     print(f'  Loaded {len(df_owid):,} rows in {time.time()-t0:.1f}s')
 
-    # Filter to project countries
-    df_owid = df_owid[df_owid['iso_code'].isin(owid_to_eurostat.keys())].copy()
-    df_owid['geo'] = df_owid['iso_code'].map(owid_to_eurostat)
-
-    # Build OWID lookup: {geo: {year: {carbon_intensity_elec, population}}}
-    owid_lookup = {}
-    for _, row in df_owid.iterrows():
-        geo = row['geo']
-        year = int(row['year'])
-        ci = row.get('carbon_intensity_elec')
-        pop = row.get('population')
-
-        if geo not in owid_lookup:
-            owid_lookup[geo] = {}
-
-        entry = {}
-        if pd.notna(ci):
-            entry['carbon_intensity_elec'] = round(float(ci), 2)
-        if pd.notna(pop):
-            entry['population'] = float(pop)
-        if entry:
-            owid_lookup[geo][year] = entry
-
-    print(f'  Built OWID lookup for {len(owid_lookup)} countries')
+    # (geo, year) panel of carbon_intensity_elec and population for project countries
+    owid = owid_panel(df_owid, owid_to_eurostat)
+
+    print(f'  Built OWID panel for {owid.index.get_level_values("geo").nunique()} countries ({len(owid):,} country-years)')
     print()
 
     # ---- Step 3: Load IEA per-capita carbon indicators ----
@@ -206,81 +306,30 @@ def main():
     # ---- Step 5: Build per-country eco data ----
     print('Step 5: Building per-country eco data...')
 
-    def get_iea_value(df, country_name):
-        """Get last available value for a country from an IEA dataframe."""
-        rows = df[df['Country'] == country_name]
-        if rows.empty:
-            return None, None
-        row = rows.iloc[0]
-        return get_last_available(row)
-
-    def get_iea_transport_percapita(country_name):
-        """Sum Cars/light trucks + Freight trucks per-capita for the latest common year."""
-        cars_rows = df_trn_cars[df_trn_cars['Country'] == country_name]
-        freight_rows = df_trn_freight[df_trn_freight['Country'] == country_name]
-        if cars_rows.empty and freight_rows.empty:
-            return None, None
-
-        # Find last year where at least one has data
-        best_year = None
-        best_sum = 0
-        for col in reversed(YEAR_COLS):
-            cars_val = None
-            freight_val = None
-            if not cars_rows.empty:
-                v = cars_rows.iloc[0].get(col)
-                if v is not None and v != '..' and pd.notna(v):
-                    try:
-                        cars_val = float(v)
-                    except (ValueError, TypeError):
-                        pass
-            if not freight_rows.empty:
-                v = freight_rows.iloc[0].get(col)
-                if v is not None and v != '..' and pd.notna(v):
-                    try:
-                        freight_val = float(v)
-                    except (ValueError, TypeError):
-                        pass
-            if cars_val is not None or freight_val is not None:
-                best_year = int(float(col))
-                best_sum = (cars_val or 0) + (freight_val or 0)
-                break
-
-        if best_year is None:
-            return None, None
-        return best_year, round(best_sum, 4)
+    # One (geo, year) panel of every indicator; latest values and rankings are read from it
+    panel = eco_panel(owid, {
+        'residential': iea_series(year_values(df_res_ci)),
+        'services': iea_series(year_values(df_svc_ci)),
+        'transport': iea_series(transport_percapita(df_trn_cars, df_trn_freight)),
+        'industry_kt': iea_series(year_values(df_ind_em)),
+        'residential_kt': iea_series(year_values(df_res_em)),
+        'services_kt': iea_series(year_values(df_svc_em)),
+        'transport_kt': iea_series(year_values(df_trn_total)),
+    })
+    print(f'  Panel: {len(panel):,} country-years')
+
+    last_ci = latest(panel['carbon_intensity_elec'])
+    last = {column: latest(panel[column]) for column in SECTORS + KT_COLUMNS}
 
     countries_data = {}
     carbon_intensity_ranking = []
 
     for geo, country_name in project_countries.items():
-        # Map project country name to IEA country name
-        iea_name = COUNTRY_NAMES.get(geo)
-
         entry = {'name': country_name}
 
         # Carbon intensity from OWID
-        owid_years = owid_lookup.get(geo, {})
-        ci_year = None
-        ci_value = None
-        population = None
-
-        # Find latest year with carbon_intensity_elec
-        for y in sorted(owid_years.keys(), reverse=True):
-            yd = owid_years[y]
-            if 'carbon_intensity_elec' in yd:
-                ci_year = y
-                ci_value = yd['carbon_intensity_elec']
-                break
-
-        # Find latest year with population
-        for y in sorted(owid_years.keys(), reverse=True):
-            yd = owid_years[y]
-            if 'population' in yd:
-                population = yd['population']
-                break
-
-        if ci_value is not None:
+        if geo in last_ci:
+            ci_year, ci_value = last_ci[geo]
             entry['carbon_intensity'] = {
                 'latest_year': ci_year,
                 'latest_value': ci_value
@@ -292,58 +341,15 @@ def main():
                 'year': ci_year
             })
 
-        # Per-capita emissions from IEA
-        if iea_name:
-            res_year, res_val = get_iea_value(df_res_ci, iea_name)
-            svc_year, svc_val = get_iea_value(df_svc_ci, iea_name)
-            trn_year, trn_val = get_iea_transport_percapita(iea_name)
-
-            # Industry: compute from total emissions / population
-            ind_em_year, ind_em_val = get_iea_value(df_ind_em, iea_name)
-            ind_percapita = None
-            ind_year = None
-            if ind_em_val is not None and population is not None and population > 0:
-                # ind_em_val is in kt CO2, population is persons
-                # tCO2/capita = (kt CO2 * 1000) / population
-                ind_percapita = round((ind_em_val * 1000) / population, 4)
-                ind_year = ind_em_year
-
-            # Find the most common year among available sectors
-            years_available = [y for y in [res_year, svc_year, trn_year, ind_year] if y is not None]
-            if years_available:
-                emissions_year = max(years_available)  # Use latest available
-                epc = {'year': emissions_year}
-                if res_val is not None:
-                    epc['residential'] = res_val
-                if svc_val is not None:
-                    epc['services'] = svc_val
-                if trn_val is not None:
-                    epc['transport'] = trn_val
-                if ind_percapita is not None:
-                    epc['industry'] = ind_percapita
-                if len(epc) > 1:  # More than just 'year'
-                    entry['emissions_per_capita'] = epc
-
-            # Total emissions (kt CO2) from IEA
-            res_em_year, res_em_val = get_iea_value(df_res_em, iea_name)
-            svc_em_year, svc_em_val = get_iea_value(df_svc_em, iea_name)
-            trn_em_year, trn_em_val = get_iea_value(df_trn_total, iea_name)
-            ind_em_year2, ind_em_val2 = get_iea_value(df_ind_em, iea_name)
-
-            em_years = [y for y in [res_em_year, svc_em_year, trn_em_year, ind_em_year2] if y is not None]
-            if em_years:
-                em_year = max(em_years)
-                etk = {'year': em_year}
-                if res_em_val is not None:
-                    etk['residential'] = round(res_em_val, 1)
-                if svc_em_val is not None:
-                    etk['services'] = round(svc_em_val, 1)
-                if trn_em_val is not None:
-                    etk['transport'] = round(trn_em_val, 1)
-                if ind_em_val2 is not None:
-                    etk['industry'] = round(ind_em_val2, 1)
-                if len(etk) > 1:
-                    entry['emissions_total_kt'] = etk
+        # Per-capita emissions from IEA (industry derived from kt CO2 / population), year = latest sector year
+        epc = latest_by_sector(last, geo)
+        if epc:
+            entry['emissions_per_capita'] = epc
+
+        # Total emissions (kt CO2) from IEA
+        etk = latest_by_sector(last, geo, suffix='_kt', decimals=1)
+        if etk:
+            entry['emissions_total_kt'] = etk
 
         # Only include countries with at least some data
         if len(entry) > 1:
@@ -352,22 +358,42 @@ def main():
     # Sort ranking by value ascending (cleanest first)
     carbon_intensity_ranking.sort(key=lambda x: x['value'])
 
+    if args.series:
+        series = panel_series(panel, countries_data.keys())
+        for geo, entry in countries_data.items():
+            entry['series'] = series.get(geo, {})
+
     print(f'  Countries with eco data: {len(countries_data)}')
     print(f'  Countries in carbon intensity ranking: {len(carbon_intensity_ranking)}')
     print()
 
     # ---- Step 6: Build output ----
     print('Step 6: Building output...')
+    generated = datetime.now().isoformat()
 
     output = {
         'metadata': {
-            'generated': datetime.now().isoformat(),
-            'sources': ['OWID Energy Data', 'IEA End-Uses & Efficiency Indicators']
+            'generated': generated,
+            'sources': ['OWID Energy Data', 'IEA End-Uses & Efficiency Indicators'],
+            'series': args.series
         },
         'countries': countries_data,
         'carbon_intensity_ranking': carbon_intensity_ranking
     }
 
+    # One-year snapshots for the ranking views
+    ci_by_year = year_rankings(panel['carbon_intensity_elec'], project_countries)
+    epc_by_year = year_rankings(emissions_per_capita_totals(panel), project_countries)
+    snapshots = {
+        year: {
+            'metadata': {'generated': generated, 'year': year},
+            'carbon_intensity_ranking': ci_by_year.get(year, []),
+            'emissions_per_capita_ranking': epc_by_year.get(year, [])
+        }
+        for year in sorted(ci_by_year.keys() | epc_by_year.keys())
+    }
+    print(f'  Year snapshots: {len(snapshots)} years')
+
     # ---- Step 7: Verification ----
     print('Step 7: Verification...')
     sample_countries = ['DE', 'FR', 'IT', 'PL', 'SE']
@@ -388,17 +414,18 @@ def main():
     print('Step 8: Saving output...')
     t0 = time.time()
 
-    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-
-    file_size = OUTPUT_JSON.stat().st_size / 1024
+    sizes = write_json(output, OUTPUT_JSON)
     print(f'  Saved to: {OUTPUT_JSON}')
-    print(f'  File size: {file_size:.1f} KB')
+    print(f'  File size: {format_sizes(sizes)}')
+
+    # Copy to public/data (with the compressed siblings)
+    print(f'  Copied to: {publish(OUTPUT_JSON, PUBLIC_JSON.parent, sizes)}')
 
-    # Copy to public/data
-    PUBLIC_JSON.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(OUTPUT_JSON, PUBLIC_JSON)
-    print(f'  Copied to: {PUBLIC_JSON}')
+    paths = write_year_snapshots(snapshots, OUTPUT_SNAPSHOTS)
+    publish_sharded(paths, OUTPUT_SNAPSHOTS.parent, PUBLIC_JSON.parent)
+    _, largest_size, total_size = sharded_size(paths)
+    print(f'  Year snapshots: {OUTPUT_SNAPSHOTS / "by_year"} ({len(paths)} files, '
+          f'largest {largest_size / 1024:.1f} KB, total {total_size / 1024:.1f} KB)')
     print(f'  Write time: {time.time()-t0:.1f}s')
     print()
 
@@ -14,11 +14,13 @@ Output:
 """
 
 import pandas as pd
-import json
 import pycountry
 from pathlib import Path
 from datetime import datetime
 
+import json_backend
+from output_writer import write_json, publish, format_sizes
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -28,10 +30,15 @@ BASE_PATH = Path(__file__).parent.parent / 'raw-data' / 'energy_prices'
 # Estimated row counts for progress calculation (update if data changes)
 ESTIMATED_TRADE_ROWS = 4_461
 OUTPUT_PATH = Path(__file__).parent.parent / 'prepared-sets'
+PUBLIC_PATH = Path(__file__).parent.parent.parent / 'public' / 'data'
 
 ENERGYCLPQ = BASE_PATH / 'energycpiq.csv'
 ELECTRICITYPRICESBYCOUNTRY = BASE_PATH / 'Electric-Prices-by-Country.csv'
 
+# pycountry fuzzy matches of names not in COUNTRY_NAMES ({name: code or null}), kept across runs;
+# delete the file to match every name again
+RESOLUTION_CACHE = Path(__file__).parent.parent / '.cache' / 'country_resolution.json'
+
 # Country name lookup (ISO 2-letter to full name)
 COUNTRY_NAMES = { 'BA': 'Bosnia-Herzegovina', 'KR': ['Korea Rep', 'Korea, Rep.'], 'GM': 'Gambia, The', 'MK': 'N Macedonia', 
                  'EX': 'ECCU', 'EU': 'Euro Area', 'TR': 'Turkey', 'BS': 'Bahamas, The', 'CD': 'Congo, Dem. Rep.',
@@ -41,6 +48,18 @@ COUNTRY_NAMES = { 'BA': 'Bosnia-Herzegovina', 'KR': ['Korea Rep', 'Korea, Rep.']
                  'TW': 'Taiwan, China', 'VE': 'Venezuela, RB', 'YE': 'Yemen, Rep.'
 }
 
+
+def build_name_index():
+    """Case-folded COUNTRY_NAMES spellings -> code (the first code listing a spelling wins)."""
+    index = {}
+    for code, names in COUNTRY_NAMES.items():
+        for name in names if isinstance(names, list) else [names]:
+            index.setdefault(name.casefold(), code)
+    return index
+
+
+NAME_INDEX = build_name_index()
+
 ROWS = [
     'Country', 'Year', 
     '1996', '1997', '1998', '1999', '2000', '2001', '2002', '2003', '2004', '2005', '2010', '2015', '2016', '2017', '2018', '2019', '2020', '2021', '2022', '2023', '2024'
@@ -78,34 +97,50 @@ def load_data():
     electricityPrices = electricityPrices.rename(columns={'Country Name': 'country'})
 
     # Replace the country names with the county codes
-    energyPrices = normalize_country_name(energyPrices)
-    electricityPrices = normalize_country_name(electricityPrices)
+    cache = load_resolution_cache()
+    cached = len(cache)
+    energyPrices = normalize_country_name(energyPrices, cache)
+    electricityPrices = normalize_country_name(electricityPrices, cache)
+    if len(cache) > cached:
+        save_resolution_cache(cache)
+    print(f'  Country names: {cached} fuzzy matches from cache, {len(cache) - cached} new')
 
     print(f'  Loaded {len(energyPrices):,} rows from ENERGYCLPQ files')
     print(f'  Loaded {len(electricityPrices):,} rows from ELECTRICITYPRICESBYCOUNTRY files')
     return {'energyPrices': energyPrices, 'electricityPrices': electricityPrices, 'price_col': price_col}
 
-def normalize_country_name(data):
-    for row in data.itertuples():
-        country_name = row.country
+def load_resolution_cache():
+    return json_backend.load(RESOLUTION_CACHE) if RESOLUTION_CACHE.exists() else {}
+
+
+def save_resolution_cache(cache):
+    RESOLUTION_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    RESOLUTION_CACHE.write_bytes(json_backend.dumps(dict(sorted(cache.items())), indent=True))
+
+
+def resolve_country(name, cache):
+    """ISO2 code for a country name, or the name itself if it cannot be resolved.
+
+    COUNTRY_NAMES spellings come first; other names longer than two characters
+    go through pycountry's fuzzy search, once ever per name thanks to `cache`.
+    """
+    code = NAME_INDEX.get(name.casefold())
+    if code is not None or len(name) <= 2:
+        return code or name
+    if name not in cache:
         try:
-            for code, name in COUNTRY_NAMES.items():
-                if isinstance(name, list):
-                    for n in name:
-                        if n.lower() == country_name.lower():
-                            data.at[row.Index, 'country'] = code
-                            break
-                else:
-                    if name.lower() == country_name.lower():
-                        data.at[row.Index, 'country'] = code
-                        break
-            # Direct fuzzy match to ISO code
-            if(isinstance(data.at[row.Index, 'country'], str) and len(data.at[row.Index, 'country']) > 2):
-                country = pycountry.countries.search_fuzzy(country_name)[0]
-                data.at[row.Index, 'country'] = country.alpha_2
+            cache[name] = pycountry.countries.search_fuzzy(name)[0].alpha_2
         except LookupError:
-            print(f"No match for: {country_name}")
+            cache[name] = None
+    if cache[name] is None:
+        print(f"No match for: {name}")
+    return cache[name] or name
 
+
+def normalize_country_name(data, cache):
+    """Replace the country names with ISO2 codes, resolving each distinct name once."""
+    resolved = {name: resolve_country(name, cache) for name in data['country'].unique() if isinstance(name, str)}
+    data['country'] = data['country'].map(resolved).fillna(data['country'])
     return data
 
 # ============================================================================
@@ -234,12 +269,12 @@ def main():
     print()
 
     print('  Writing JSON file...')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-
-    file_size = output_file.stat().st_size / (1024 * 1024)
+    sizes = write_json(output, output_file)
     print(f'  Saved to: {output_file}')
-    print(f'  File size: {file_size:.2f} MB')
+    print(f'  File size: {format_sizes(sizes)}')
+
+    # Copy to public/data (with the compressed siblings)
+    print(f'  Copied to: {publish(output_file, PUBLIC_PATH, sizes)}')
 
     # Final summary
     print()
@@ -5,20 +5,29 @@ dependency metrics, and production/consumption by resource.
 Input files:
 - combined_import_dependency.csv (53K rows) - Dependency % metrics
 - combined_energy_trade.csv (31.8M rows) - Import/export volumes by partner
+  (either may also be read from the .parquet copy written by the combine_*
+  scripts with --format parquet, see --input-format)
 - owid-energy-data.xlsx - Production/consumption by resource (OWID)
 - country_code_mastersheet.json - Country code mappings (Eurostat ↔ OWID)
 
 Output:
 - energy_mix.json
+- energy_mix/index.json + energy_mix/countries/<geo>.json (with --sharded)
 """
 
+import argparse
+import io
 import pandas as pd
 import numpy as np
-import json
 import time
 from pathlib import Path
 from datetime import datetime
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import json_backend
+from owid_loader import load_owid, owid_production_consumption
+from output_writer import write_json, write_json_stream, write_sharded, sharded_size, format_sizes
+from trade_cube import TradeCube
 
 # ============================================================================
 # Configuration
@@ -26,13 +35,54 @@ from collections import defaultdict
 
 BASE_PATH = Path(__file__).parent.parent / 'base-data' / '05_Energy-Imports-Exports'
 
-# Estimated row counts for progress calculation (update if data changes)
-ESTIMATED_TRADE_ROWS = 31_800_000  # ~31.8M rows in combined_energy_trade.csv
+# Trade row counts come from the manifest written by combine_trade.py; without
+# one, progress is estimated from the CSV size (~41 bytes per row)
+TRADE_CSV_BYTES_PER_ROW = 41
+
 OUTPUT_PATH = Path(__file__).parent.parent / 'prepared-sets'
+SHARDED_OUTPUT_PATH = OUTPUT_PATH / 'energy_mix'
 
 DEPENDENCY_FILE = BASE_PATH / 'import_dependency_eurostat' / 'output' / 'combined_import_dependency.csv'
 TRADE_FILE = BASE_PATH / 'energy_trade_eurostat' / 'output' / 'combined_energy_trade.csv'
 
+# Aggregated trade cube saved by Phase 2 (reloaded with --reuse-trade-cube)
+TRADE_CUBE_FILE = BASE_PATH / 'energy_trade_eurostat' / 'output' / 'trade_cube.npz'
+
+# Columns read from the dependency intermediate
+DEPENDENCY_COLUMNS = ['indicator', 'siec', 'partner', 'geo', 'year', 'value']
+
+# Trade rows are summed per (flow, geo, year, energy_type, partner)
+TRADE_KEY_COLUMNS = ['flow', 'geo', 'year', 'energy_type', 'partner']
+TRADE_USECOLS = TRADE_KEY_COLUMNS + ['value']
+TRADE_DTYPES = {
+    'flow': 'category',
+    'geo': 'category',
+    'year': 'int16',
+    'energy_type': 'category',
+    'partner': 'category',
+    'value': 'float64'
+}
+
+# Size of the trade file partitions reduced by each worker
+TRADE_PARTITION_BYTES = 32 * 1024 * 1024  # CSV byte ranges
+TRADE_PARTITION_ROWS = 1_000_000           # Parquet row groups
+
+# Aggregate reporters/partners that are excluded from partner breakdowns
+AGGREGATE_GEOS = ['EU27_2020', 'EA20']
+AGGREGATE_PARTNERS = ['TOTAL', 'THRD', 'NSP']
+
+# Bucket for the partners collapsed by --top-partners (treated as a regional aggregate by the map)
+OTHER_PARTNER = 'OTHER'
+OTHER_PARTNER_NAME = 'Other partners'
+
+# Output schema versions: 1 = partner objects with names/units inline,
+# 2 = positional partner tuples resolved through country_lookup and energy_type_units
+SCHEMA_VERSIONS = [1, 2]
+PARTNER_FIELDS = {
+    'partners_by_type': ['geo', 'value', 'share_pct'],
+    'partners': ['geo', 'share_pct']
+}
+
 # Country name lookup (ISO 2-letter to full name)
 COUNTRY_NAMES = {
     'AD': 'Andorra', 'AE': 'United Arab Emirates', 'AF': 'Afghanistan', 'AL': 'Albania',
@@ -252,92 +302,112 @@ def print_phase_header(phase_num, title, total_phases=5):
     print('=' * 60)
 
 
+# ============================================================================
+# Intermediate Inputs (CSV or Parquet)
+# ============================================================================
+
+def resolve_intermediate(csv_path, input_format='auto'):
+    """Return (path, format) of an intermediate, preferring an up-to-date Parquet copy."""
+    parquet_path = csv_path.with_suffix('.parquet')
+    if input_format == 'csv':
+        return csv_path, 'csv'
+    if input_format == 'parquet':
+        return parquet_path, 'parquet'
+
+    if parquet_path.exists() and (not csv_path.exists() or
+                                  parquet_path.stat().st_mtime >= csv_path.stat().st_mtime):
+        return parquet_path, 'parquet'
+    return csv_path, 'csv'
+
+
+def load_trade_manifest(trade_path):
+    """Load the row-count manifest combine_trade.py writes next to a trade intermediate."""
+    manifest_path = trade_path.with_name(trade_path.name + '.manifest.json')
+    if not manifest_path.exists() or not trade_path.exists():
+        return None
+    if manifest_path.stat().st_mtime < trade_path.stat().st_mtime:
+        print(f'  WARNING: {manifest_path.name} is older than {trade_path.name}, ignoring it')
+        return None
+
+    return json_backend.load(manifest_path)
+
+
+def trade_row_filter():
+    """Arrow filter expression matching the rows kept by reduce_trade_chunk."""
+    import pyarrow.compute as pc
+
+    return (~pc.field('geo').isin(AGGREGATE_GEOS) &
+            ~pc.field('partner').isin(AGGREGATE_PARTNERS) &
+            pc.field('value').is_valid())
+
+
 # ============================================================================
 # Phase 1: Load and Process Dependency Data
 # ============================================================================
 
-def load_dependency_data():
+def load_dependency_data(input_format='auto'):
     """Load and process import dependency indicators."""
     print_phase_header(1, 'Loading dependency data')
     phase_start = time.time()
 
-    print('  Loading CSV file...')
-    df = pd.read_csv(DEPENDENCY_FILE)
+    dependency_path, dependency_format = resolve_intermediate(DEPENDENCY_FILE, input_format)
+    if dependency_format == 'parquet':
+        print(f'  Loading Parquet file ({dependency_path.name})...')
+        df = pd.read_parquet(dependency_path, columns=DEPENDENCY_COLUMNS,
+                             filters=[('indicator', 'in', ['ID', 'ID3CF'])])
+    else:
+        print('  Loading CSV file...')
+        df = pd.read_csv(dependency_path, usecols=DEPENDENCY_COLUMNS)
     print(f'  Loaded {len(df):,} rows from dependency file')
 
     # Report indicators present
     print(f'  Indicators: {df["indicator"].unique().tolist()}')
 
     # Build dependency lookup: {geo: {year: {metrics}}}
-    dependency_data = defaultdict(lambda: defaultdict(dict))
-
-    # Process overall dependency (ID with partner=TOTAL)
-    overall = df[(df['indicator'] == 'ID') & (df['partner'] == 'TOTAL')]
-    total_overall = len(overall)
-    print(f'  Processing overall dependency (ID): {total_overall:,} rows')
-
-    start_time = time.time()
-    for i, (_, row) in enumerate(overall.iterrows()):
-        geo = row['geo']
-        year = int(row['year'])
-        siec = row['siec']
-        value = row['value'] if pd.notna(row['value']) else None
-
-        # Skip excluded SIEC codes
-        if siec in EXCLUDED_SIEC_CODES:
-            continue
-
-        fuel_name = SIEC_TO_FUEL.get(siec, siec)
+    dependency_data = build_dependency_lookup(df)
 
-        if fuel_name == 'total' or siec == 'TOTAL':
-            dependency_data[geo][year]['overall'] = value
-        else:
-            if 'by_fuel' not in dependency_data[geo][year]:
-                dependency_data[geo][year]['by_fuel'] = {}
-            if fuel_name not in dependency_data[geo][year]['by_fuel']:
-                dependency_data[geo][year]['by_fuel'][fuel_name] = {}
-            dependency_data[geo][year]['by_fuel'][fuel_name]['overall'] = value
-
-        if (i + 1) % 5000 == 0 or i + 1 == total_overall:
-            print_progress(i + 1, total_overall, start_time, 'Overall dep')
-    print()  # New line after progress bar
+    # Note: IDOGAS and IDOOIL (gas/oil origins) are skipped as they have limited data coverage
 
-    # Process third country dependency (ID3CF with partner=THRD)
-    third_country = df[(df['indicator'] == 'ID3CF') & (df['partner'] == 'THRD')]
-    total_third = len(third_country)
-    print(f'  Processing third country dependency (ID3CF): {total_third:,} rows')
+    phase_elapsed = time.time() - phase_start
+    print(f'  Processed {len(dependency_data)} countries in {format_time(phase_elapsed)}')
+    return dependency_data
 
-    start_time = time.time()
-    for i, (_, row) in enumerate(third_country.iterrows()):
-        geo = row['geo']
-        year = int(row['year'])
-        siec = row['siec']
-        value = row['value'] if pd.notna(row['value']) else None
 
-        # Skip excluded SIEC codes
-        if siec in EXCLUDED_SIEC_CODES:
-            continue
+# Dependency subsets: (indicator, partner) -> metric name in the output
+DEPENDENCY_METRICS = {
+    ('ID', 'TOTAL'): 'overall',          # overall dependency
+    ('ID3CF', 'THRD'): 'third_countries'  # dependency on third (non-EU) countries
+}
 
-        fuel_name = SIEC_TO_FUEL.get(siec, siec)
 
-        if fuel_name == 'total' or siec == 'TOTAL':
-            dependency_data[geo][year]['third_countries'] = value
+def build_dependency_lookup(df):
+    """{geo: {year: {overall, third_countries, by_fuel: {fuel: {overall, third_countries}}}}} from dependency rows.
+
+    SIEC codes are mapped to fuel names as a column; the nested dicts are then
+    filled in one pass in row order (overall rows first), so later duplicates
+    overwrite earlier values as before.
+    """
+    subsets = []
+    for (indicator, partner), metric in DEPENDENCY_METRICS.items():
+        subset = df[(df['indicator'] == indicator) & (df['partner'] == partner)]
+        print(f'  Processing {metric} dependency ({indicator}): {len(subset):,} rows')
+        subsets.append(subset.assign(metric=metric))
+    rows = pd.concat(subsets)
+    rows = rows[~rows['siec'].isin(EXCLUDED_SIEC_CODES)]
+
+    fuel = rows['siec'].map(SIEC_TO_FUEL).fillna(rows['siec'])
+    is_total = ((fuel == 'total') | (rows['siec'] == 'TOTAL')).tolist()
+    values = rows['value'].astype(object).where(rows['value'].notna(), None).tolist()
+
+    dependency_data = {}
+    for geo, year, metric, fuel_name, total, value in zip(rows['geo'].tolist(), rows['year'].astype(int).tolist(),
+                                                          rows['metric'].tolist(), fuel.tolist(), is_total, values):
+        year_entry = dependency_data.setdefault(geo, {}).setdefault(year, {})
+        if total:
+            year_entry[metric] = value
         else:
-            if 'by_fuel' not in dependency_data[geo][year]:
-                dependency_data[geo][year]['by_fuel'] = {}
-            if fuel_name not in dependency_data[geo][year]['by_fuel']:
-                dependency_data[geo][year]['by_fuel'][fuel_name] = {}
-            dependency_data[geo][year]['by_fuel'][fuel_name]['third_countries'] = value
-
-        if (i + 1) % 5000 == 0 or i + 1 == total_third:
-            print_progress(i + 1, total_third, start_time, 'Third country')
-    print()  # New line after progress bar
-
-    # Note: IDOGAS and IDOOIL (gas/oil origins) are skipped as they have limited data coverage
-
-    phase_elapsed = time.time() - phase_start
-    print(f'  Processed {len(dependency_data)} countries in {format_time(phase_elapsed)}')
-    return dict(dependency_data)
+            year_entry.setdefault('by_fuel', {}).setdefault(fuel_name, {})[metric] = value
+    return dependency_data
 
 
 def load_gae_data():
@@ -352,27 +422,52 @@ def load_gae_data():
     df = pd.read_csv(GAE_FILE)
     print(f'  Loaded {len(df):,} GAE rows')
 
-    # Build lookup: {geo: {year: {siec: value}}}
-    gae_data = defaultdict(lambda: defaultdict(dict))
-    for _, row in df.iterrows():
-        gae_data[row['geo']][int(row['year'])][row['siec']] = row['value']
-
-    # Calculate shares: for each subcategory, compute % of parent GAE
-    # Result: {geo: {year: {fuel_name: share_pct}}}
-    gae_shares = defaultdict(lambda: defaultdict(dict))
-    for geo in gae_data:
-        for year in gae_data[geo]:
-            values = gae_data[geo][year]
-            for subcat_siec, parent_siec in SUBCAT_TO_PARENT_SIEC.items():
-                parent_val = values.get(parent_siec, 0)
-                subcat_val = values.get(subcat_siec, 0)
-                if parent_val > 0:
-                    fuel_name = SIEC_TO_FUEL.get(subcat_siec, subcat_siec)
-                    share = round(subcat_val / parent_val * 100, 2)
-                    gae_shares[geo][year][fuel_name] = share
-
+    gae_shares = gae_subcategory_shares(df)
     print(f'  Computed GAE shares for {len(gae_shares)} countries')
-    return dict(gae_shares)
+    return gae_shares
+
+
+def gae_subcategory_shares(df):
+    """{geo: {fuel_name: share_pct}} per year: each subcategory's % of its parent GAE (parents > 0 only).
+
+    GAE rows are pivoted to one column per SIEC code and the shares computed
+    as column division. Countries and years keep the order they first appear
+    in the file; a missing subcategory counts as 0.
+    """
+    df = df.assign(year=df['year'].astype(int))
+    pairs = df[['geo', 'year']].drop_duplicates()
+    df = df.drop_duplicates(['geo', 'year', 'siec'], keep='last')
+    geo_order = {geo: i for i, geo in enumerate(pairs['geo'].unique())}
+    pairs = pairs.iloc[np.argsort(pairs['geo'].map(geo_order).to_numpy(), kind='stable')]
+
+    wide = df.assign(present=True).pivot(index=['geo', 'year'], columns='siec', values=['value', 'present'])
+    wide = wide.reindex(pd.MultiIndex.from_frame(pairs))
+
+    def column(siec):
+        if siec not in wide['value'].columns:
+            return np.full(len(wide), np.nan), np.zeros(len(wide), dtype=bool)
+        return wide['value'][siec].to_numpy(dtype='float64'), wide['present'][siec].notna().to_numpy()
+
+    fuels, shares, keep = [], [], []
+    for subcat_siec, parent_siec in SUBCAT_TO_PARENT_SIEC.items():
+        parent_val, _ = column(parent_siec)
+        subcat_val, subcat_present = column(subcat_siec)
+        subcat_val = np.where(subcat_present, subcat_val, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares.append(round2(subcat_val / parent_val * 100))
+        keep.append(parent_val > 0)
+        fuels.append(SIEC_TO_FUEL.get(subcat_siec, subcat_siec))
+
+    # (pair, subcategory) cells in row-major order
+    shares, keep = np.column_stack(shares), np.column_stack(keep)
+    rows, cols = np.nonzero(keep)
+    geos = pairs['geo'].to_numpy()[rows].tolist()
+    years = pairs['year'].to_numpy()[rows].tolist()
+
+    gae_shares = {}
+    for geo, year, col, share in zip(geos, years, cols.tolist(), shares[rows, cols].tolist()):
+        gae_shares.setdefault(geo, {}).setdefault(year, {})[fuels[col]] = share
+    return gae_shares
 
 
 # ============================================================================
@@ -386,14 +481,13 @@ def load_owid_data():
 
     # Load country code mastersheet for ISO3 → Eurostat ISO2 mapping
     print('  Loading country code mastersheet...')
-    with open(MASTERSHEET_FILE, 'r', encoding='utf-8') as f:
-        mastersheet = json.load(f)
+    mastersheet = json_backend.load(MASTERSHEET_FILE)
     owid_to_eurostat = mastersheet['owid_to_eurostat']
     print(f'  Loaded {len(owid_to_eurostat)} country mappings')
 
     # Load OWID dataset
     print(f'  Loading OWID energy data from {OWID_FILE.name}...')
-    df = pd.read_excel(OWID_FILE)
+    df = load_owid(OWID_FILE, list(OWID_PRODUCTION_COLS) + list(OWID_CONSUMPTION_COLS))
     print(f'  Loaded {len(df):,} rows, {len(df.columns)} columns')
 
     # Filter to countries in our mastersheet
@@ -411,8 +505,6 @@ def load_owid_data():
         print(f'  All {len(all_eurostat_geos)} project countries found in OWID')
 
     # Build lookup: {geo: {year: {production: {...}, consumption: {...}}}}
-    owid_data = defaultdict(lambda: defaultdict(lambda: {'production': {}, 'consumption': {}}))
-
     all_owid_cols = list(OWID_PRODUCTION_COLS.keys()) + list(OWID_CONSUMPTION_COLS.keys())
     existing_cols = [c for c in all_owid_cols if c in df_filtered.columns]
     missing_cols = [c for c in all_owid_cols if c not in df_filtered.columns]
@@ -420,29 +512,8 @@ def load_owid_data():
         print(f'  WARNING: Missing OWID columns: {missing_cols}')
     print(f'  Extracting columns: {existing_cols}')
 
-    total_rows = len(df_filtered)
-    start_time = time.time()
-
-    for i, (_, row) in enumerate(df_filtered.iterrows()):
-        geo = row['geo']
-        year = int(row['year'])
-
-        for owid_col, energy_type in OWID_PRODUCTION_COLS.items():
-            if owid_col in df_filtered.columns:
-                value = row[owid_col]
-                if pd.notna(value):
-                    owid_data[geo][year]['production'][energy_type] = round(float(value), 3)
-
-        for owid_col, energy_type in OWID_CONSUMPTION_COLS.items():
-            if owid_col in df_filtered.columns:
-                value = row[owid_col]
-                if pd.notna(value):
-                    owid_data[geo][year]['consumption'][energy_type] = round(float(value), 3)
-
-        if (i + 1) % 500 == 0 or i + 1 == total_rows:
-            print_progress(i + 1, total_rows, start_time, 'OWID data')
-
-    print()  # New line after progress bar
+    owid_data = owid_production_consumption(df_filtered, owid_to_eurostat, OWID_PRODUCTION_COLS,
+                                             OWID_CONSUMPTION_COLS)
 
     # Stats
     countries_with_prod = sum(1 for geo_data in owid_data.values()
@@ -453,238 +524,339 @@ def load_owid_data():
     print(f'  {len(owid_data)} countries, {countries_with_prod} with production, {countries_with_cons} with consumption')
     print(f'  Phase completed in {format_time(phase_elapsed)}')
 
-    return dict(owid_data)
+    return owid_data
 
 
 # ============================================================================
 # Phase 2: Process Trade Data (Chunked)
 # ============================================================================
 
-def process_trade_data(chunk_size=1_000_000):
-    """Process trade data in chunks to manage memory."""
+def reduce_trade_chunk(chunk):
+    """Reduce one chunk of trade rows to summed values per trade key."""
+    # Filter out aggregates and invalid partners
+    chunk = chunk[~chunk['geo'].isin(AGGREGATE_GEOS)]
+    chunk = chunk[~chunk['partner'].isin(AGGREGATE_PARTNERS)]
+    chunk = chunk[chunk['value'].notna()]
+
+    return chunk.groupby(TRADE_KEY_COLUMNS, observed=True, sort=False)['value'].sum()
+
+
+def merge_trade_partials(partials):
+    """Merge partial chunk sums into a single series indexed by trade key (in first-seen key order)."""
+    partials = [p for p in partials if len(p)]
+    if not partials:
+        index = pd.MultiIndex.from_arrays([[] for _ in TRADE_KEY_COLUMNS], names=TRADE_KEY_COLUMNS)
+        return pd.Series([], index=index, dtype='float64', name='value')
+
+    merged = pd.concat(partials)
+    return merged.groupby(level=TRADE_KEY_COLUMNS, sort=False).sum()
+
+
+def plan_trade_partitions(trade_path, trade_format, chunk_size, row_filter=None):
+    """Split the trade intermediate into partitions that can be read independently.
+
+    CSV files are cut into byte ranges aligned to line starts, Parquet files
+    into runs of consecutive row groups. The serial and parallel paths reduce
+    the same partitions in the same order, so their results are identical.
+    """
+    if trade_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        metadata = pq.ParquetFile(trade_path).metadata
+        partitions, row_groups, rows = [], [], 0
+        for i in range(metadata.num_row_groups):
+            row_groups.append(i)
+            rows += metadata.row_group(i).num_rows
+            if rows >= TRADE_PARTITION_ROWS:
+                partitions.append(('parquet', str(trade_path), row_groups, row_filter, chunk_size))
+                row_groups, rows = [], 0
+        if row_groups:
+            partitions.append(('parquet', str(trade_path), row_groups, row_filter, chunk_size))
+        return partitions
+
+    size = trade_path.stat().st_size
+    with open(trade_path, 'rb') as f:
+        header = f.readline().decode('utf-8').strip().split(',')
+        bounds = [f.tell()]
+        while bounds[-1] + TRADE_PARTITION_BYTES < size:
+            f.seek(bounds[-1] + TRADE_PARTITION_BYTES)
+            f.readline()  # move to the start of the next line
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+
+    return [('csv', str(trade_path), (start, end), header, chunk_size)
+            for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def reduce_trade_partition(partition):
+    """Read and reduce one trade partition; returns (rows read, partial sums).
+
+    Runs in worker processes when --workers > 1, so it only takes picklable
+    arguments and opens the file itself.
+    """
+    kind, path, span, extra, chunk_size = partition
+    partials = []
+    rows = 0
+
+    if kind == 'parquet':
+        import pyarrow.parquet as pq
+
+        table = pq.ParquetFile(path).read_row_groups(span, columns=TRADE_USECOLS)
+        if extra is not None:
+            table = table.filter(extra)
+        for batch in table.to_batches(max_chunksize=chunk_size):
+            chunk = batch.to_pandas()
+            rows += len(chunk)
+            partials.append(reduce_trade_chunk(chunk))
+    else:
+        start, end = span
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = io.BytesIO(f.read(end - start))
+        reader = pd.read_csv(data, header=None, names=extra, usecols=TRADE_USECOLS,
+                             dtype=TRADE_DTYPES, chunksize=chunk_size)
+        for chunk in reader:
+            rows += len(chunk)
+            partials.append(reduce_trade_chunk(chunk))
+
+    return rows, merge_trade_partials(partials)
+
+
+def process_trade_data(chunk_size=1_000_000, merge_every=8, input_format='auto', workers=1):
+    """Process trade data in partitions, optionally across worker processes."""
     print_phase_header(2, 'Processing trade data (chunked)')
     phase_start = time.time()
 
-    # Accumulators for aggregated data
-    # {geo: {year: {energy_type: {partner: value}}}}
-    imports_by_partner = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(float))))
-    exports_by_partner = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(float))))
+    trade_path, trade_format = resolve_intermediate(TRADE_FILE, input_format)
 
-    # Totals by energy type
-    imports_totals = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
-    exports_totals = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+    # Each partition is reduced to grouped sums keyed on TRADE_KEY_COLUMNS;
+    # partial results are folded together every `merge_every` partitions.
+    merged = None
+    partials = []
 
-    chunk_num = 0
+    partition_num = 0
     total_rows = 0
-    rows_processed_in_chunk = 0
 
-    print(f'  Reading {TRADE_FILE.name} in chunks of {chunk_size:,} rows...')
-    print(f'  Estimated total: ~{ESTIMATED_TRADE_ROWS:,} rows')
+    manifest = load_trade_manifest(trade_path)
+    sparse = bool(manifest and manifest.get('sparse'))
+
+    print(f'  Reading {trade_path.name} in chunks of {chunk_size:,} rows...')
+    if sparse:
+        print('  Sparse intermediate: aggregates and missing values already removed')
+
+    row_filter = None
+    if trade_format == 'parquet':
+        # Aggregates and missing values are dropped while scanning the file
+        import pyarrow.dataset as ds
+        row_filter = None if sparse else trade_row_filter()
+        if sparse:
+            expected_rows = manifest['rows']
+        else:
+            expected_rows = ds.dataset(trade_path, format='parquet').count_rows(filter=row_filter)
+    else:
+        if manifest:
+            expected_rows = manifest['rows']
+        else:
+            expected_rows = trade_path.stat().st_size // TRADE_CSV_BYTES_PER_ROW
+            print('  No manifest found, estimating rows from file size')
+
+    partitions = plan_trade_partitions(trade_path, trade_format, chunk_size, row_filter)
+    print(f'  Expected rows: {expected_rows:,}')
+    print(f'  Partitions: {len(partitions)}, workers: {workers}')
     print()
 
-    for chunk in pd.read_csv(TRADE_FILE, chunksize=chunk_size):
-        chunk_num += 1
-        chunk_start = time.time()
-        total_rows += len(chunk)
-
-        # Filter out aggregates and invalid partners
-        chunk = chunk[~chunk['geo'].isin(['EU27_2020', 'EA20'])]
-        chunk = chunk[~chunk['partner'].isin(['TOTAL', 'THRD', 'NSP'])]
-        chunk = chunk[chunk['value'].notna()]
-
-        rows_processed_in_chunk = len(chunk)
-
-        # Process imports
-        imports_chunk = chunk[chunk['flow'] == 'IMPORT']
-        for _, row in imports_chunk.iterrows():
-            geo = row['geo']
-            year = int(row['year'])
-            energy_type = row['energy_type']
-            partner = row['partner']
-            value = float(row['value'])
-
-            imports_by_partner[geo][year][energy_type][partner] += value
-            imports_totals[geo][year][energy_type] += value
-
-        # Process exports
-        exports_chunk = chunk[chunk['flow'] == 'EXPORT']
-        for _, row in exports_chunk.iterrows():
-            geo = row['geo']
-            year = int(row['year'])
-            energy_type = row['energy_type']
-            partner = row['partner']
-            value = float(row['value'])
-
-            exports_by_partner[geo][year][energy_type][partner] += value
-            exports_totals[geo][year][energy_type] += value
-
-        # Print progress with ETA
-        print_progress(total_rows, ESTIMATED_TRADE_ROWS, phase_start, 'Trade data')
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results = executor.map(reduce_trade_partition, partitions) if executor else map(reduce_trade_partition, partitions)
+        for rows, partial in results:
+            partition_num += 1
+            total_rows += rows
+
+            partials.append(partial)
+            if len(partials) >= merge_every:
+                merged = merge_trade_partials([merged] + partials if merged is not None else partials)
+                partials = []
+
+            # Print progress with ETA
+            print_progress(total_rows, max(expected_rows, total_rows), phase_start, 'Trade data')
+    finally:
+        if executor:
+            executor.shutdown()
 
     print()  # New line after progress bar
 
+    merged = merge_trade_partials([merged] + partials if merged is not None else partials)
+    print(f'  Reduced to {len(merged):,} (flow, geo, year, energy_type, partner) groups')
+
     phase_elapsed = time.time() - phase_start
-    print(f'  Finished processing {total_rows:,} rows in {chunk_num} chunks')
+    print(f'  Finished processing {total_rows:,} rows in {partition_num} partitions')
+    print(f'  Throughput: {total_rows / max(phase_elapsed, 1e-9):,.0f} rows/s')
     print(f'  Phase completed in {format_time(phase_elapsed)}')
 
-    return {
-        'imports_by_partner': dict(imports_by_partner),
-        'exports_by_partner': dict(exports_by_partner),
-        'imports_totals': dict(imports_totals),
-        'exports_totals': dict(exports_totals)
-    }
-
-
-def calculate_shares_and_rankings(trade_data):
-    """Calculate partner shares and identify top partners."""
+    cube = TradeCube.from_trade_sums(merged)
+    print(f'  Trade cube (flow x geo x partner x energy_type x year): {cube.shape}')
+    return cube
+
+
+def round2(values):
+    """Round an array like round(x, 2); np.round can differ on .xx5 ties since x * 100 is inexact."""
+    scaled = values * 100
+    rounded = np.round(values, 2)
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(x, 2) for x in values[ties].tolist()]
+    return rounded
+
+
+def group_bounds(keys):
+    """(start, stop) positions of runs of equal rows in lexsorted key columns."""
+    n = len(keys[0])
+    if n == 0:
+        return []
+    changed = np.zeros(n, dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(changed)
+    return zip(starts.tolist(), np.append(starts[1:], n).tolist())
+
+
+def collapse_partners(partners, top_partners):
+    """Keep the top_partners largest entries of a sorted partner list and sum the rest into OTHER."""
+    if not top_partners or len(partners) <= top_partners:
+        return partners
+    rest = partners[top_partners:]
+    other = {'geo': OTHER_PARTNER, 'name': OTHER_PARTNER_NAME}
+    if 'value' in rest[0]:
+        other['value'] = round(sum(p['value'] for p in rest), 2)
+    other['share_pct'] = round(sum(p['share_pct'] for p in rest), 2)
+    return partners[:top_partners] + [other]
+
+
+def calculate_shares_and_rankings(cube, top_partners=None):
+    """Calculate partner shares and identify top partners.
+
+    With top_partners, each partner list keeps its top_partners largest entries
+    and the remainder is summed into one OTHER entry.
+    """
     print_phase_header(3, 'Calculating shares and rankings')
     phase_start = time.time()
 
-    results = defaultdict(lambda: defaultdict(dict))
-
-    # Count total geo-year combinations for progress
-    total_combinations = sum(len(years) for years in trade_data['imports_by_partner'].values())
-    processed = 0
-    start_time = time.time()
-
-    for geo, years_data in trade_data['imports_by_partner'].items():
-        for year, energy_types in years_data.items():
-            year_data = {'imports': {}, 'exports': {}}
-
-            # Process imports
-            total_by_type = {}
-            all_partners = defaultdict(float)
-
-            for energy_type, partners in energy_types.items():
-                type_total = trade_data['imports_totals'].get(geo, {}).get(year, {}).get(energy_type, 0)
-                total_by_type[energy_type] = {
-                    'value': round(type_total, 2),
-                    'unit': ENERGY_TYPE_UNITS.get(energy_type, 'UNKNOWN')
-                }
-
-                # Accumulate partner totals across energy types
-                for partner, value in partners.items():
-                    all_partners[partner] += value
-
-            year_data['imports']['total_by_type'] = total_by_type
-
-            # Calculate per-type partner shares (for map arrows)
-            partners_by_type = {}
-            for energy_type, partners in energy_types.items():
-                type_total = trade_data['imports_totals'].get(geo, {}).get(year, {}).get(energy_type, 0)
-                if type_total > 0:
-                    type_partners = []
-                    for partner, value in partners.items():
-                        share = (value / type_total) * 100
-                        if share > 0:
-                            type_partners.append({
-                                'geo': partner,
-                                'name': COUNTRY_NAMES.get(partner, partner),
-                                'value': round(value, 2),
-                                'share_pct': round(share, 2)
-                            })
-                    type_partners.sort(key=lambda x: x['share_pct'], reverse=True)
-                    if type_partners:
-                        partners_by_type[energy_type] = type_partners
-
-            if partners_by_type:
-                year_data['imports']['partners_by_type'] = partners_by_type
-
-            # Calculate partner shares (aggregated across all types)
-            grand_total = sum(all_partners.values())
-            if grand_total > 0:
-                partner_shares = []
-
-                for partner, value in all_partners.items():
-                    share = (value / grand_total) * 100
-
-                    partner_shares.append({
-                        'geo': partner,
-                        'name': COUNTRY_NAMES.get(partner, partner),
-                        'share_pct': round(share, 2)
-                    })
-
-                # Sort by share and filter out zero shares
-                partner_shares.sort(key=lambda x: x['share_pct'], reverse=True)
-                year_data['imports']['partners'] = [p for p in partner_shares if p['share_pct'] > 0]
-
-            # Process exports similarly
-            if geo in trade_data['exports_by_partner'] and year in trade_data['exports_by_partner'][geo]:
-                exp_energy_types = trade_data['exports_by_partner'][geo][year]
-
-                total_by_type_exp = {}
-                all_partners_exp = defaultdict(float)
-
-                for energy_type, partners in exp_energy_types.items():
-                    type_total = trade_data['exports_totals'].get(geo, {}).get(year, {}).get(energy_type, 0)
-                    total_by_type_exp[energy_type] = {
-                        'value': round(type_total, 2),
-                        'unit': ENERGY_TYPE_UNITS.get(energy_type, 'UNKNOWN')
-                    }
-
-                    for partner, value in partners.items():
-                        all_partners_exp[partner] += value
-
-                year_data['exports']['total_by_type'] = total_by_type_exp
-
-                # Calculate per-type partner shares for exports
-                partners_by_type_exp = {}
-                for energy_type, partners in exp_energy_types.items():
-                    type_total = trade_data['exports_totals'].get(geo, {}).get(year, {}).get(energy_type, 0)
-                    if type_total > 0:
-                        type_partners = []
-                        for partner, value in partners.items():
-                            share = (value / type_total) * 100
-                            if share > 0:
-                                type_partners.append({
-                                    'geo': partner,
-                                    'name': COUNTRY_NAMES.get(partner, partner),
-                                    'value': round(value, 2),
-                                    'share_pct': round(share, 2)
-                                })
-                        type_partners.sort(key=lambda x: x['share_pct'], reverse=True)
-                        if type_partners:
-                            partners_by_type_exp[energy_type] = type_partners
-
-                if partners_by_type_exp:
-                    year_data['exports']['partners_by_type'] = partners_by_type_exp
-
-                grand_total_exp = sum(all_partners_exp.values())
-                if grand_total_exp > 0:
-                    partner_shares_exp = []
-
-                    for partner, value in all_partners_exp.items():
-                        share = (value / grand_total_exp) * 100
-
-                        partner_shares_exp.append({
-                            'geo': partner,
-                            'name': COUNTRY_NAMES.get(partner, partner),
-                            'share_pct': round(share, 2)
-                        })
-
-                    # Sort by share and filter out zero shares
-                    partner_shares_exp.sort(key=lambda x: x['share_pct'], reverse=True)
-                    year_data['exports']['partners'] = [p for p in partner_shares_exp if p['share_pct'] > 0]
-
-            results[geo][year] = year_data
-
-            processed += 1
-            if processed % 100 == 0 or processed == total_combinations:
-                print_progress(processed, total_combinations, start_time, 'Shares')
-
-    print()  # New line after progress bar
+    # Whole-array totals, computed once for every flow/geo/year
+    present = cube.present()
+    totals = cube.totals()                            # (flow, geo, energy_type, year)
+    partner_totals = cube.partner_totals()            # (flow, geo, partner, year)
+    grand_totals = np.nansum(partner_totals, axis=2)  # (flow, geo, year)
+
+    # Country-years are those with import data; both flows are computed for them at once
+    geo_years = present[cube.flow_index['IMPORT']].any(axis=(1, 2))  # (geo, year)
+    flow_keys = ['imports' if flow == 'IMPORT' else 'exports' for flow in cube.flows]
+    partner_names = [COUNTRY_NAMES.get(code, code) for code in cube.partners]
+
+    results = {}
+    for g, y in np.argwhere(geo_years):
+        results.setdefault(cube.geos[g], {})[cube.years[y]] = {'imports': {}, 'exports': {}}
+
+    def flow_data(f, g, y):
+        return results[cube.geos[g]][cube.years[y]][flow_keys[f]]
+
+    # total_by_type: every reported (flow, geo, year, energy_type)
+    f, g, e, y = np.nonzero(~np.isnan(totals) & geo_years[None, :, None, :])
+    order = np.lexsort((e, y, g, f))
+    f, g, y, e = f[order], g[order], y[order], e[order]
+    type_values = round2(totals[f, g, e, y]).tolist()
+    type_codes = [cube.energy_types[i] for i in e.tolist()]
+    bounds = group_bounds((f, g, y))
+    f, g, y = f.tolist(), g.tolist(), y.tolist()
+    for start, stop in bounds:
+        flow_data(f[start], g[start], y[start])['total_by_type'] = {
+            type_codes[i]: {
+                'value': type_values[i],
+                'unit': ENERGY_TYPE_UNITS.get(type_codes[i], 'UNKNOWN')
+            } for i in range(start, stop)}
+
+    # Per-type partner shares (for map arrows), sorted by (group, share desc, partner)
+    values = cube.values
+    f, g, p, e, y = np.nonzero((values > 0) & geo_years[None, :, None, None, :])
+    type_totals = totals[f, g, e, y]
+    keep = type_totals > 0
+    f, g, p, e, y = f[keep], g[keep], p[keep], e[keep], y[keep]
+    shares = round2(values[f, g, p, e, y] / type_totals[keep] * 100)
+    order = np.lexsort((p, -shares, e, y, g, f))
+    f, g, p, e, y, shares = f[order], g[order], p[order], e[order], y[order], shares[order]
+    partner_values = round2(values[f, g, p, e, y]).tolist()
+    partner_ids, share_list = p.tolist(), shares.tolist()
+    bounds = group_bounds((f, g, y, e))
+    f, g, y, e = f.tolist(), g.tolist(), y.tolist(), e.tolist()
+    for start, stop in bounds:
+        partners_by_type = flow_data(f[start], g[start], y[start]).setdefault('partners_by_type', {})
+        partners_by_type[cube.energy_types[e[start]]] = collapse_partners([{
+            'geo': cube.partners[partner_ids[i]],
+            'name': partner_names[partner_ids[i]],
+            'value': partner_values[i],
+            'share_pct': share_list[i]
+        } for i in range(start, stop)], top_partners)
+
+    # Partner shares aggregated across all types
+    f, g, p, y = np.nonzero(~np.isnan(partner_totals) & (grand_totals > 0)[:, :, None, :]
+                            & geo_years[None, :, None, :])
+    shares = round2(partner_totals[f, g, p, y] / grand_totals[f, g, y] * 100)
+    keep = shares > 0
+    f, g, p, y, shares = f[keep], g[keep], p[keep], y[keep], shares[keep]
+    order = np.lexsort((p, -shares, y, g, f))
+    f, g, p, y, shares = f[order], g[order], p[order], y[order], shares[order]
+    partner_ids, share_list = p.tolist(), shares.tolist()
+    bounds = group_bounds((f, g, y))
+    f, g, y = f.tolist(), g.tolist(), y.tolist()
+    for start, stop in bounds:
+        flow_data(f[start], g[start], y[start])['partners'] = collapse_partners([{
+            'geo': cube.partners[partner_ids[i]],
+            'name': partner_names[partner_ids[i]],
+            'share_pct': share_list[i]
+        } for i in range(start, stop)], top_partners)
 
     phase_elapsed = time.time() - phase_start
-    print(f'  Calculated shares for {len(results)} countries in {format_time(phase_elapsed)}')
-    return dict(results)
+    if top_partners:
+        print(f'  Partner lists truncated to the top {top_partners} plus {OTHER_PARTNER}')
+    print(f'  Calculated shares for {len(results)} countries '
+          f'({int(geo_years.sum())} country-years) in {format_time(phase_elapsed)}')
+    return results
 
 
 # ============================================================================
 # Phase 4: Build JSON Structure
 # ============================================================================
 
-def build_json_output(dependency_data, trade_results, owid_data=None, gae_shares=None):
-    """Combine all data into final JSON structure."""
+def compact_trade_flow(flow):
+    """Schema v2 form of one imports/exports entry: positional partner tuples, bare type totals."""
+    compact = {'total_by_type': {energy_type: total['value']
+                                 for energy_type, total in flow['total_by_type'].items()}}
+    if 'partners_by_type' in flow:
+        compact['partners_by_type'] = {
+            energy_type: [[p[field] for field in PARTNER_FIELDS['partners_by_type']] for p in partners]
+            for energy_type, partners in flow['partners_by_type'].items()}
+    if 'partners' in flow:
+        compact['partners'] = [[p[field] for field in PARTNER_FIELDS['partners']] for p in flow['partners']]
+    return compact
+
+
+def trade_partner_codes(flow):
+    """Partner codes referenced by one imports/exports entry."""
+    codes = {p['geo'] for p in flow.get('partners', [])}
+    for partners in flow.get('partners_by_type', {}).values():
+        codes.update(p['geo'] for p in partners)
+    return codes
+
+
+def build_json_parts(dependency_data, trade_results, owid_data=None, gae_shares=None, top_partners=None,
+                     schema=1):
+    """Split the JSON output into (head, countries, tail) for incremental writing.
+
+    head is {'metadata': ...}, countries a generator yielding one (geo, entry)
+    pair at a time, and tail() returns {'country_lookup': ...} once the
+    generator is exhausted (v2 collects partner codes while building).
+    """
     print_phase_header(4, 'Building JSON output')
     phase_start = time.time()
 
@@ -702,71 +874,80 @@ def build_json_output(dependency_data, trade_results, owid_data=None, gae_shares
     all_years = sorted([y for y in all_years if isinstance(y, int)])
     print(f'  Countries: {len(all_countries)}, Years: {all_years[0]}-{all_years[-1]}')
 
-    # Build country data
-    countries = {}
-    sorted_countries = sorted(all_countries)
-    total_countries = len(sorted_countries)
-    start_time = time.time()
+    partner_codes = set()
 
-    for i, geo in enumerate(sorted_countries):
-        # Skip aggregates
-        if geo in ['EU27_2020', 'EA20']:
-            continue
+    def countries():
+        sorted_countries = sorted(all_countries)
+        total_countries = len(sorted_countries)
+        built = 0
+        start_time = time.time()
 
-        country_entry = {
-            'name': COUNTRY_NAMES.get(geo, geo),
-            'years': {}
-        }
+        for i, geo in enumerate(sorted_countries):
+            # Skip aggregates
+            if geo in AGGREGATE_GEOS:
+                continue
 
-        for year in all_years:
-            year_entry = {}
-
-            # Add dependency data
-            if geo in dependency_data and year in dependency_data[geo]:
-                dep_data = dependency_data[geo][year]
-                year_entry['dependency'] = {
-                    'overall': dep_data.get('overall'),
-                    'third_countries': dep_data.get('third_countries'),
-                }
-                if 'by_fuel' in dep_data:
-                    year_entry['dependency']['by_fuel'] = dep_data['by_fuel']
-                    # Inject GAE shares into subcategory fuel entries
-                    if geo in gae_shares and year in gae_shares[geo]:
-                        for fuel_name, share in gae_shares[geo][year].items():
-                            if fuel_name in year_entry['dependency']['by_fuel']:
-                                year_entry['dependency']['by_fuel'][fuel_name]['gae_share'] = share
-
-            # Add trade data
-            if geo in trade_results and year in trade_results[geo]:
-                trade = trade_results[geo][year]
-                if trade.get('imports'):
-                    year_entry['imports'] = trade['imports']
-                if trade.get('exports'):
-                    year_entry['exports'] = trade['exports']
-
-            # Add OWID production/consumption data
-            if geo in owid_data and year in owid_data[geo]:
-                owid_year = owid_data[geo][year]
-                if owid_year.get('production'):
-                    year_entry['production'] = owid_year['production']
-                if owid_year.get('consumption'):
-                    year_entry['consumption'] = owid_year['consumption']
-
-            # Only add year if it has data
-            if year_entry:
-                country_entry['years'][str(year)] = year_entry
-
-        # Only add country if it has data
-        if country_entry['years']:
-            countries[geo] = country_entry
-
-        if (i + 1) % 10 == 0 or i + 1 == total_countries:
-            print_progress(i + 1, total_countries, start_time, 'Building')
+            country_entry = {
+                'name': COUNTRY_NAMES.get(geo, geo),
+                'years': {}
+            }
 
-    print()  # New line after progress bar
+            for year in all_years:
+                year_entry = {}
 
-    # Build final output
-    output = {
+                # Add dependency data
+                if geo in dependency_data and year in dependency_data[geo]:
+                    dep_data = dependency_data[geo][year]
+                    year_entry['dependency'] = {
+                        'overall': dep_data.get('overall'),
+                        'third_countries': dep_data.get('third_countries'),
+                    }
+                    if 'by_fuel' in dep_data:
+                        year_entry['dependency']['by_fuel'] = dep_data['by_fuel']
+                        # Inject GAE shares into subcategory fuel entries
+                        if geo in gae_shares and year in gae_shares[geo]:
+                            for fuel_name, share in gae_shares[geo][year].items():
+                                if fuel_name in year_entry['dependency']['by_fuel']:
+                                    year_entry['dependency']['by_fuel'][fuel_name]['gae_share'] = share
+
+                # Add trade data
+                if geo in trade_results and year in trade_results[geo]:
+                    trade = trade_results[geo][year]
+                    for flow in ('imports', 'exports'):
+                        if not trade.get(flow):
+                            continue
+                        if schema == 2:
+                            year_entry[flow] = compact_trade_flow(trade[flow])
+                            partner_codes.update(trade_partner_codes(trade[flow]))
+                        else:
+                            year_entry[flow] = trade[flow]
+
+                # Add OWID production/consumption data
+                if geo in owid_data and year in owid_data[geo]:
+                    owid_year = owid_data[geo][year]
+                    if owid_year.get('production'):
+                        year_entry['production'] = owid_year['production']
+                    if owid_year.get('consumption'):
+                        year_entry['consumption'] = owid_year['consumption']
+
+                # Only add year if it has data
+                if year_entry:
+                    country_entry['years'][str(year)] = year_entry
+
+            # Only add country if it has data
+            if country_entry['years']:
+                built += 1
+                yield geo, country_entry
+
+            if (i + 1) % 10 == 0 or i + 1 == total_countries:
+                print_progress(i + 1, total_countries, start_time, 'Building')
+
+        print()  # New line after progress bar
+
+        phase_elapsed = time.time() - phase_start
+        print(f'  Built output with {built} countries in {format_time(phase_elapsed)}')
+
+    head = {
         'metadata': {
             'generated': datetime.now().isoformat(),
             'sources': [
@@ -781,14 +962,31 @@ def build_json_output(dependency_data, trade_results, owid_data=None, gae_shares
             'energy_type_units': ENERGY_TYPE_UNITS,
             'production_consumption_unit': 'TWh',
             'production_types': list(OWID_PRODUCTION_COLS.values()),
-            'consumption_types': list(OWID_CONSUMPTION_COLS.values())
-        },
-        'countries': countries,
-        'country_lookup': {k: v for k, v in COUNTRY_NAMES.items() if k in all_countries}
+            'consumption_types': list(OWID_CONSUMPTION_COLS.values()),
+            'top_partners': top_partners,
+            'schema_version': schema
+        }
     }
+    if schema == 2:
+        head['metadata']['partner_fields'] = PARTNER_FIELDS
 
-    phase_elapsed = time.time() - phase_start
-    print(f'  Built output with {len(countries)} countries in {format_time(phase_elapsed)}')
+    def tail():
+        # v2 partner tuples carry no names, so the lookup also covers every partner code
+        lookup_names = dict(COUNTRY_NAMES, **{OTHER_PARTNER: OTHER_PARTNER_NAME})
+        lookup_codes = all_countries | partner_codes
+        return {'country_lookup': {k: v for k, v in lookup_names.items() if k in lookup_codes}}
+
+    return head, countries(), tail
+
+
+def build_json_output(dependency_data, trade_results, owid_data=None, gae_shares=None, top_partners=None,
+                      schema=1):
+    """Combine all data into final JSON structure."""
+    head, countries, tail = build_json_parts(dependency_data, trade_results, owid_data, gae_shares,
+                                             top_partners, schema)
+    output = dict(head)
+    output['countries'] = dict(countries)
+    output.update(tail())
     return output
 
 
@@ -796,14 +994,50 @@ def build_json_output(dependency_data, trade_results, owid_data=None, gae_shares
 # Phase 5: Verification
 # ============================================================================
 
-def verify_output(output):
-    """Run verification checks on the output."""
+VERIFY_COUNTRIES = ['DE', 'FR', 'PL', 'IT', 'ES']
+
+
+def collect_verification(countries, summary):
+    """Pass (geo, entry) pairs through, recording what verify_output needs in summary."""
+    for geo, country in countries:
+        summary['country_count'] += 1
+        for year_data in country['years'].values():
+            overall = year_data.get('dependency', {}).get('overall')
+            if overall is not None:
+                summary['dependency_values'].append(overall)
+        if geo in VERIFY_COUNTRIES:
+            summary['samples'][geo] = country
+        yield geo, country
+
+
+def verification_summary():
+    return {'country_count': 0, 'dependency_values': [], 'samples': {}}
+
+
+def verify_output(output, summary=None):
+    """Run verification checks on the output.
+
+    When the countries were streamed to disk, `output` holds only metadata and
+    country_lookup and `summary` comes from collect_verification().
+    """
     print_phase_header(5, 'Verification')
 
+    if summary is None:
+        summary = verification_summary()
+        for _ in collect_verification(output['countries'].items(), summary):
+            pass
+    samples = summary['samples']
+
     issues = []
 
+    def partner_name_share(partner):
+        """(name, share_pct) of a schema v1 partner object or v2 [geo, share_pct] tuple."""
+        if isinstance(partner, list):
+            return output['country_lookup'].get(partner[0], partner[0]), partner[-1]
+        return partner['name'], partner['share_pct']
+
     # Check 1: Country count
-    country_count = len(output['countries'])
+    country_count = summary['country_count']
     print(f'1. Country count: {country_count}')
     if country_count < 30:
         issues.append(f'Low country count: {country_count}')
@@ -813,16 +1047,15 @@ def verify_output(output):
     print(f'2. Year range: {time_range[0]}-{time_range[1]}')
 
     # Check 3: Sample countries have data
-    sample_countries = ['DE', 'FR', 'PL', 'IT', 'ES']
     sample_years = [2000, 2015, 2023]
 
     print('3. Sample data spot-check:')
-    for geo in sample_countries:
-        if geo not in output['countries']:
+    for geo in VERIFY_COUNTRIES:
+        if geo not in samples:
             issues.append(f'Missing country: {geo}')
             continue
 
-        country = output['countries'][geo]
+        country = samples[geo]
         for year in sample_years:
             year_str = str(year)
             if year_str not in country['years']:
@@ -836,20 +1069,14 @@ def verify_output(output):
             if 'imports' in year_data and 'partners' in year_data['imports']:
                 partners = year_data['imports']['partners']
                 if partners:
-                    top_partner = f"{partners[0]['name']} ({partners[0]['share_pct']}%)"
+                    name, share = partner_name_share(partners[0])
+                    top_partner = f'{name} ({share}%)'
 
             print(f'   {geo}/{year}: dep={dep}%, third={third}%, top={top_partner}')
 
     # Check 4: Dependency values in valid range
     print('4. Dependency value range check:')
-    dep_values = []
-    for geo, country in output['countries'].items():
-        for year, year_data in country['years'].items():
-            if 'dependency' in year_data:
-                overall = year_data['dependency'].get('overall')
-                if overall is not None:
-                    dep_values.append(overall)
-
+    dep_values = summary['dependency_values']
     if dep_values:
         print(f'   Min: {min(dep_values):.1f}%, Max: {max(dep_values):.1f}%')
         print(f'   (Negative values indicate net exporters)')
@@ -857,13 +1084,14 @@ def verify_output(output):
     # Check 5: Partners list check
     print('5. Partners check (sample):')
     for geo in ['DE', 'FR']:
-        if geo in output['countries']:
+        if geo in samples:
             for year in ['2020', '2023']:
-                if year in output['countries'][geo]['years']:
-                    year_data = output['countries'][geo]['years'][year]
+                if year in samples[geo]['years']:
+                    year_data = samples[geo]['years'][year]
                     if 'imports' in year_data and 'partners' in year_data['imports']:
                         partners = year_data['imports']['partners']
-                        print(f'   {geo}/{year}: {len(partners)} partners, top 3 = {sum(p["share_pct"] for p in partners[:3]):.1f}%')
+                        top3 = sum(partner_name_share(p)[1] for p in partners[:3])
+                        print(f'   {geo}/{year}: {len(partners)} partners, top 3 = {top3:.1f}%')
 
     if issues:
         print()
@@ -881,7 +1109,36 @@ def verify_output(output):
 # Main
 # ============================================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Create the energy_mix.json dataset.')
+    parser.add_argument('--input-format', choices=['auto', 'csv', 'parquet'], default='auto',
+                        help='Format of the combined_* intermediates to read '
+                             '(auto prefers an up-to-date .parquet copy)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for the trade data reduction (Phase 2)')
+    parser.add_argument('--reuse-trade-cube', action='store_true',
+                        help=f'Load {TRADE_CUBE_FILE.name} instead of re-reading the trade data '
+                             'when it is newer than the trade intermediate')
+    parser.add_argument('--top-partners', type=int, default=None, metavar='K',
+                        help=f'Keep the K largest partners per list and merge the rest into {OTHER_PARTNER} '
+                             '(default: all partners)')
+    parser.add_argument('--schema', type=int, choices=SCHEMA_VERSIONS, default=2,
+                        help='Output schema: 2 stores partners as [geo, value, share_pct] tuples resolved '
+                             'through country_lookup; 1 is the previous layout with names and units inline')
+    parser.add_argument('--pretty', action='store_true',
+                        help='Indent the JSON output instead of writing it compact')
+    parser.add_argument('--float-precision', type=int, default=None, metavar='N',
+                        help='Round every float in the output to N decimals')
+    parser.add_argument('--sharded', action='store_true',
+                        help=f'Also write {SHARDED_OUTPUT_PATH.name}/index.json and one file per country')
+    args = parser.parse_args()
+    if args.top_partners is not None and args.top_partners < 1:
+        parser.error('--top-partners must be at least 1')
+    return args
+
+
 def main():
+    args = parse_args()
     overall_start = time.time()
 
     print('=' * 60)
@@ -895,7 +1152,7 @@ def main():
     OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
 
     # Phase 1: Load dependency data
-    dependency_data = load_dependency_data()
+    dependency_data = load_dependency_data(input_format=args.input_format)
 
     # Phase 1b: Load OWID production/consumption data
     owid_data = load_owid_data()
@@ -903,36 +1160,72 @@ def main():
     # Phase 1c: Load GAE data for subcategory shares
     gae_shares = load_gae_data()
 
-    # Phase 2: Process trade data
-    trade_data = process_trade_data(chunk_size=500_000)
+    # Phase 2: Process trade data (or reload the saved trade cube)
+    trade_path, _ = resolve_intermediate(TRADE_FILE, args.input_format)
+    if (args.reuse_trade_cube and TRADE_CUBE_FILE.exists() and
+            (not trade_path.exists() or TRADE_CUBE_FILE.stat().st_mtime >= trade_path.stat().st_mtime)):
+        print_phase_header(2, 'Loading saved trade cube')
+        trade_cube = TradeCube.load(TRADE_CUBE_FILE)
+        print(f'  Loaded {TRADE_CUBE_FILE.name}: {trade_cube.shape}')
+    else:
+        trade_cube = process_trade_data(chunk_size=500_000, input_format=args.input_format,
+                                        workers=args.workers)
+        trade_cube.save(TRADE_CUBE_FILE)
+        print(f'  Saved trade cube to {TRADE_CUBE_FILE}')
 
     # Phase 3: Calculate shares and rankings
-    trade_results = calculate_shares_and_rankings(trade_data)
+    trade_results = calculate_shares_and_rankings(trade_cube, top_partners=args.top_partners)
+
+    output_file = OUTPUT_PATH / 'energy_mix.json'
 
-    # Phase 4: Build JSON output
-    output = build_json_output(dependency_data, trade_results, owid_data, gae_shares)
+    # Compact single-file output is streamed one country at a time; --pretty and
+    # --sharded need the whole output in memory
+    if args.pretty or args.sharded:
+        # Phase 4: Build JSON output
+        output = build_json_output(dependency_data, trade_results, owid_data, gae_shares,
+                                   top_partners=args.top_partners, schema=args.schema)
 
-    # Phase 5: Verify
-    verify_output(output)
+        # Phase 5: Verify
+        verify_output(output)
+
+        save_start = time.time()
+        sizes = write_json(output, output_file, compact=not args.pretty, precision=args.float_precision)
+        save_elapsed = time.time() - save_start
+    else:
+        # Phase 4: Build JSON output, encoding each country as soon as it is built
+        head, countries, tail = build_json_parts(dependency_data, trade_results, owid_data, gae_shares,
+                                                 top_partners=args.top_partners, schema=args.schema)
+        summary = verification_summary()
+        tail_members = {}
+
+        def streamed_tail():
+            tail_members.update(tail())
+            return tail_members
+
+        save_start = time.time()
+        sizes = write_json_stream(output_file, head, 'countries', collect_verification(countries, summary),
+                                  streamed_tail, precision=args.float_precision)
+        save_elapsed = time.time() - save_start
+
+        # Phase 5: Verify
+        verify_output({**head, **tail_members}, summary)
 
-    # Save output
-    output_file = OUTPUT_PATH / 'energy_mix.json'
     print()
     print('=' * 60)
     print('Saving output')
     print('=' * 60)
 
-    print('  Writing JSON file...')
-    save_start = time.time()
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-    save_elapsed = time.time() - save_start
-
-    file_size = output_file.stat().st_size / (1024 * 1024)
     print(f'  Saved to: {output_file}')
-    print(f'  File size: {file_size:.2f} MB')
+    print(f'  File size: {format_sizes(sizes)}')
     print(f'  Write time: {format_time(save_elapsed)}')
 
+    if args.sharded:
+        paths = write_sharded(output, SHARDED_OUTPUT_PATH, compact=not args.pretty, precision=args.float_precision)
+        index_size, largest_size, total_size = sharded_size(paths)
+        print(f'  Sharded output: {SHARDED_OUTPUT_PATH} ({len(paths) - 1} country files)')
+        print(f'  index.json: {index_size / 1024:.1f} KB, largest country file: {largest_size / 1024:.1f} KB, '
+              f'total: {total_size / (1024 * 1024):.2f} MB')
+
     # Final summary
     overall_elapsed = time.time() - overall_start
     print()
@@ -0,0 +1,199 @@
+"""
+JSON encode/decode through the fastest installed library.
+
+Backends, in order of preference: orjson, msgspec, then the stdlib json module.
+Set JSON_BACKEND=orjson|msgspec|json to force one (e.g. for benchmarks).
+
+    import json_backend
+    raw = json_backend.dumps(data)          # compact UTF-8 bytes
+    data = json_backend.load(path)
+
+iter_members() decodes a large top-level object from a file one member at a
+time (with the stdlib decoder), e.g. one country of energy_mix.json:
+
+    for key, value in json_backend.iter_members(path, nested=['countries']):
+        ...  # key is 'metadata', ('countries', 'DE'), ..., 'country_lookup'
+
+All backends write compact, non-ASCII-escaped UTF-8 and stringify non-string
+dict keys (e.g. int years). Differences that remain:
+- NaN/Infinity floats are written as null by orjson and msgspec and as NaN
+  tokens by json (the web app reads both as null). On decode, NaN/Infinity
+  tokens become None with every backend.
+- Float formatting of very large/small numbers (1e16 vs 1e+16).
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+_COMPACT = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+_INDENTED = json.JSONEncoder(ensure_ascii=False, indent=2)
+_STREAM_DECODER = json.JSONDecoder(parse_constant=lambda constant: None)
+_WHITESPACE = ' \t\n\r'
+
+
+def _json_loads(data):
+    return json.loads(data, parse_constant=lambda constant: None)
+
+
+def _numpy_item(obj):
+    """msgspec enc_hook: encode numpy scalars as Python numbers."""
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _orjson_dumps(obj, indent=False):
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+    return orjson.dumps(obj, option=option)
+
+
+def _msgspec_dumps(obj, indent=False):
+    raw = _MSGSPEC_ENCODER.encode(obj)
+    return msgspec.json.format(raw, indent=2) if indent else raw
+
+
+def _stdlib_dumps(obj, indent=False):
+    return (_INDENTED if indent else _COMPACT).encode(obj).encode('utf-8')
+
+
+def _fast_loads(decode):
+    """Wrap a fast decoder so documents with NaN/Infinity tokens fall back to the stdlib parser."""
+    def loads(data):
+        try:
+            return decode(data)
+        except ValueError:
+            return _json_loads(data)
+    return loads
+
+
+BACKENDS = {'json': (_stdlib_dumps, _json_loads)}
+if msgspec is not None:
+    _MSGSPEC_ENCODER = msgspec.json.Encoder(enc_hook=_numpy_item)
+    BACKENDS['msgspec'] = (_msgspec_dumps, _fast_loads(msgspec.json.Decoder().decode))
+if orjson is not None:
+    BACKENDS['orjson'] = (_orjson_dumps, _fast_loads(orjson.loads))
+
+PREFERENCE = ['orjson', 'msgspec', 'json']
+
+
+def select(name=None):
+    """Make `name` (or the preferred installed backend) the active one; returns its name."""
+    global BACKEND, _dumps, _loads
+    name = name or os.environ.get('JSON_BACKEND') or next(n for n in PREFERENCE if n in BACKENDS)
+    if name not in BACKENDS:
+        raise ValueError(f'JSON backend {name!r} is not installed (available: {sorted(BACKENDS)})')
+    BACKEND = name
+    _dumps, _loads = BACKENDS[name]
+    return name
+
+
+def dumps(obj, indent=False):
+    """Encode obj as UTF-8 JSON bytes (compact unless indent)."""
+    return _dumps(obj, indent)
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    return _loads(data)
+
+
+def load(path):
+    """Decode a JSON file."""
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+
+select()
+
+
+class _TextStream:
+    """Buffered text reader that decodes one JSON value at a time with raw_decode()."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        """Append the next chunk (at least as large as the pending text); False at end of file."""
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer)))
+        self.buffer += chunk
+        return bool(chunk)
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f'Expected one of {chars!r}, found {char or "end of file"!r}')
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _STREAM_DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number ending at the buffer end may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_members(path, nested=(), chunk_size=1 << 20):
+    """Yield (key, value) for each member of the top-level JSON object in a file.
+
+    Object members named in `nested` are not decoded whole: each of their
+    members is yielded as ((key, name), value) instead. NaN/Infinity decode as
+    None. Only the member being decoded is held in memory.
+    """
+    with open(path, encoding='utf-8') as f:
+        stream = _TextStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key in nested:
+                stream.expect('{')
+                if stream.peek() == '}':
+                    stream.expect('}')
+                else:
+                    while True:
+                        name = stream.value()
+                        stream.expect(':')
+                        yield (key, name), stream.value()
+                        if stream.expect(',}') == '}':
+                            break
+            else:
+                yield key, stream.value()
+            if stream.expect(',}') == '}':
+                return
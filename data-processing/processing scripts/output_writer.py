@@ -0,0 +1,432 @@
+"""
+Shared writers for the prepared JSON datasets.
+
+write_json() writes compact JSON (no indentation, minimal separators, optional
+float rounding) plus precompressed .gz and .br siblings, so static hosting can
+serve the compressed bytes directly. Brotli output needs the optional `brotli`
+package and is skipped when it is not installed.
+
+write_json_stream() produces the same bytes as compact write_json() for a
+{**head, key: dict(items), **tail} document, but encodes the `items` one at a
+time, so the caller can generate large mappings without holding them in memory.
+
+Every write records a content hash (sha256 of the bytes with
+metadata.generated blanked) in manifest.json next to the outputs, and a file
+whose hash is unchanged is not rewritten. publish() copies a dataset into
+public/data under a content-hashed name (eco_data.<hash>.json) listed in
+public/data/manifest.json, which the web app uses to resolve dataset URLs, so
+unchanged datasets keep their URL and stay cached.
+
+Sharded layout (energy_mix):
+    <directory>/index.json            metadata, country_lookup and per-country name/years
+    <directory>/countries/<geo>.json  one country entry ({name, years}) of the full file
+
+The web app loads index.json on startup and fetches a country file only when
+that country is selected.
+
+Year snapshots (energy_mix, eco_data):
+    <directory>/by_year/<year>.json   one year across all countries, restricted to
+                                      the fields the map and ranking views use
+
+so a year change in the web app is one small request.
+"""
+
+import gzip
+import hashlib
+import shutil
+from pathlib import Path
+
+import json_backend
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_SUFFIXES = ['.gz', '.br']
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+SHARD_DIRS = ['countries', 'by_year']
+
+
+def round_floats(obj, precision):
+    """Copy of a JSON-like structure with every float rounded to `precision` decimals."""
+    if isinstance(obj, float):
+        return round(obj, precision)
+    if isinstance(obj, dict):
+        return {k: round_floats(v, precision) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [round_floats(v, precision) for v in obj]
+    return obj
+
+
+def encode_json(data, compact=True, precision=None):
+    """Serialize data to UTF-8 JSON bytes; compact drops indentation and separator spaces."""
+    if precision is not None:
+        data = round_floats(data, precision)
+    return json_backend.dumps(data, indent=not compact)
+
+
+def remove_compressed_siblings(path):
+    """Delete .gz/.br siblings so stale compressed bytes are never served."""
+    for suffix in COMPRESSED_SUFFIXES:
+        Path(f'{path}{suffix}').unlink(missing_ok=True)
+
+
+def write_compressed_siblings(path, raw):
+    """Write <path>.gz (and <path>.br when brotli is available) for the given bytes."""
+    remove_compressed_siblings(path)
+    sizes = {}
+    gz = gzip.compress(raw, compresslevel=9, mtime=0)
+    Path(f'{path}.gz').write_bytes(gz)
+    sizes['gz'] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(raw, quality=11)
+        Path(f'{path}.br').write_bytes(br)
+        sizes['br'] = len(br)
+    return sizes
+
+
+def generated_token(data):
+    """Encoded metadata.generated timestamp of a dataset, or None."""
+    metadata = data.get('metadata') if isinstance(data, dict) else None
+    if isinstance(metadata, dict) and metadata.get('generated') is not None:
+        return json_backend.dumps(metadata['generated'])
+    return None
+
+
+def content_hasher(token):
+    """sha256 over written chunks, with the first occurrence of `token` (the timestamp) blanked."""
+    hasher = hashlib.sha256()
+    pending = [token]
+
+    def update(chunk):
+        if pending[0] is not None and pending[0] in chunk:
+            chunk = chunk.replace(pending[0], b'""', 1)
+            pending[0] = None
+        hasher.update(chunk)
+    return hasher, update
+
+
+def read_manifest(directory):
+    """manifest.json of an output directory ({} if missing)."""
+    path = Path(directory) / MANIFEST_NAME
+    return json_backend.load(path) if path.exists() else {}
+
+
+def write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST_NAME
+    raw = json_backend.dumps(dict(sorted(manifest.items())), indent=True)
+    if not path.exists() or path.read_bytes() != raw:
+        path.write_bytes(raw)
+
+
+def unchanged(manifest, name, sha256, path, compress):
+    """True if the manifest already records this content for an existing file (and siblings).
+
+    With compress, the .gz sibling must exist, and so must the .br one when
+    brotli is installed or the entry records a br size.
+    """
+    entry = manifest.get(name)
+    if not entry or entry['sha256'] != sha256 or not Path(path).exists():
+        return False
+    if not compress:
+        return True
+    suffixes = ['.gz'] + (['.br'] if brotli is not None or 'br' in entry else [])
+    return all(Path(f'{path}{suffix}').exists() for suffix in suffixes)
+
+
+def manifest_entry(sha256, sizes, file=None):
+    entry = {'file': file} if file else {}
+    entry['sha256'] = sha256
+    entry['size'] = sizes['raw']
+    entry.update({key: sizes[key] for key in ('gz', 'br') if key in sizes})
+    return entry
+
+
+def write_json(data, path, compact=True, precision=None, compress=True, manifest_root=None):
+    """Write data as JSON (plus compressed siblings) unless the content is unchanged.
+
+    The content hash ignores metadata.generated and is recorded in
+    <manifest_root>/manifest.json (default: the file's directory). Returns
+    byte sizes {'raw', 'gz', 'br'} plus 'sha256' and 'skipped'.
+    """
+    path = Path(path)
+    root = Path(manifest_root or path.parent)
+    name = path.relative_to(root).as_posix()
+
+    raw = encode_json(data, compact, precision)
+    hasher, update = content_hasher(generated_token(data))
+    update(raw)
+    sha256 = hasher.hexdigest()
+
+    manifest = read_manifest(root)
+    if unchanged(manifest, name, sha256, path, compress):
+        return {'raw': len(raw), **{k: v for k, v in manifest[name].items() if k in ('gz', 'br')},
+                'sha256': sha256, 'skipped': True}
+
+    path.write_bytes(raw)
+    sizes = {'raw': len(raw)}
+    if compress:
+        sizes.update(write_compressed_siblings(path, raw))
+    else:
+        remove_compressed_siblings(path)
+
+    manifest[name] = manifest_entry(sha256, sizes)
+    write_manifest(root, manifest)
+    return {**sizes, 'sha256': sha256, 'skipped': False}
+
+
+def write_json_stream(path, head, key, items, tail=None, precision=None, compress=True, manifest_root=None,
+                      generated=None):
+    """Stream {**head, key: {k: v for k, v in items}, **tail} as compact JSON; returns sizes like write_json.
+
+    `tail` may be a callable, evaluated after `items` is exhausted (for values
+    collected while generating the items). When the metadata is in the tail,
+    pass its timestamp as `generated` so the content hash still ignores it.
+    Output goes to temporary files that replace the previous ones only when
+    the content hash changed.
+    """
+    path = Path(path)
+    root = Path(manifest_root or path.parent)
+    name = path.relative_to(root).as_posix()
+    sizes = {'raw': 0}
+    token = generated_token(head) if generated is None else json_backend.dumps(generated)
+    hasher, update = content_hasher(token)
+
+    tmp = path.with_name(f'{path.name}.tmp')
+    targets = {tmp: path}
+    gz_file = open(f'{tmp}.gz', 'wb') if compress else None
+    gz = gzip.GzipFile(filename='', mode='wb', fileobj=gz_file, compresslevel=9, mtime=0) if compress else None
+    br = brotli.Compressor(quality=11) if compress and brotli is not None else None
+    br_file = open(f'{tmp}.br', 'wb') if br is not None else None
+
+    with open(tmp, 'wb') as raw:
+        def write(data):
+            raw.write(data)
+            update(data)
+            sizes['raw'] += len(data)
+            if gz is not None:
+                gz.write(data)
+            if br is not None:
+                br_file.write(br.process(data))
+
+        def write_members(members, separator):
+            for name, value in members:
+                write(separator + json_backend.dumps(name) + b':' + encode_json(value, precision=precision))
+                separator = b','
+            return separator
+
+        write(b'{')
+        separator = write_members(head.items(), b'')
+        write(separator + json_backend.dumps(key) + b':{')
+        write_members(items, b'')
+        write(b'}')
+        write_members((tail() if callable(tail) else tail or {}).items(), b',')
+        write(b'}')
+
+    if gz is not None:
+        gz.close()
+        gz_file.close()
+        sizes['gz'] = Path(f'{tmp}.gz').stat().st_size
+        targets[Path(f'{tmp}.gz')] = Path(f'{path}.gz')
+    if br is not None:
+        br_file.write(br.finish())
+        br_file.close()
+        sizes['br'] = Path(f'{tmp}.br').stat().st_size
+        targets[Path(f'{tmp}.br')] = Path(f'{path}.br')
+
+    sha256 = hasher.hexdigest()
+    manifest = read_manifest(root)
+    skipped = unchanged(manifest, name, sha256, path, compress)
+    if skipped:
+        for written in targets:
+            written.unlink()
+    else:
+        remove_compressed_siblings(path)
+        for written, target in targets.items():
+            written.replace(target)
+        manifest[name] = manifest_entry(sha256, sizes)
+        write_manifest(root, manifest)
+    return {**sizes, 'sha256': sha256, 'skipped': skipped}
+
+
+def hashed_name(relative, sha256):
+    """'energy_mix/index.json' -> 'energy_mix/index.<hash>.json'."""
+    relative = Path(relative)
+    return relative.with_name(f'{relative.stem}.{sha256[:HASH_LENGTH]}{relative.suffix}').as_posix()
+
+
+def publish(path, root, sizes, relative=None):
+    """Copy a written file (and its compressed siblings) into root under a content-hashed name.
+
+    `sizes` is the result of write_json/write_json_stream. The copy is recorded
+    in <root>/manifest.json as {name: {file, sha256, size, gz, br}}, where name
+    is the path relative to root without .json (e.g. 'eco_data',
+    'energy_mix/countries/DE'). Top-level datasets (eco_data.json, ...) also
+    keep a plain-named copy, which the web app loads when the manifest is
+    missing; shards and year snapshots are only fetched through the manifest,
+    so they are published under the hashed name alone. Nothing is copied when
+    the manifest already has this hash. Returns the hashed path.
+    """
+    path, root = Path(path), Path(root)
+    relative = Path(relative or path.name)
+    name = relative.with_suffix('').as_posix()
+    sha256 = sizes['sha256']
+    hashed = root / hashed_name(relative, sha256)
+
+    plain = root / relative
+    targets = [hashed, plain] if len(relative.parts) == 1 else [hashed]
+    if plain not in targets:
+        # Plain copies of shards written by earlier versions
+        plain.unlink(missing_ok=True)
+        remove_compressed_siblings(plain)
+
+    manifest = read_manifest(root)
+    entry = manifest.get(name)
+    if unchanged(manifest, name, sha256, hashed, 'gz' in sizes) and all(t.exists() for t in targets):
+        return hashed
+
+    hashed.parent.mkdir(parents=True, exist_ok=True)
+    for target in targets:
+        remove_compressed_siblings(target)
+        shutil.copy2(path, target)
+        for suffix in COMPRESSED_SUFFIXES:
+            if Path(f'{path}{suffix}').exists():
+                shutil.copy2(f'{path}{suffix}', f'{target}{suffix}')
+
+    if entry and entry.get('file') and entry['file'] != hashed.relative_to(root).as_posix():
+        remove_published(root, entry)
+    manifest[name] = manifest_entry(sha256, sizes, hashed.relative_to(root).as_posix())
+    write_manifest(root, manifest)
+    return hashed
+
+
+def remove_published(root, entry):
+    """Delete a previously published hashed file and its siblings."""
+    old = Path(root) / entry['file']
+    old.unlink(missing_ok=True)
+    remove_compressed_siblings(old)
+
+
+def publish_sharded(written, source_root, root):
+    """Publish write_sharded()/write_year_snapshots() output; country and year files dropped since the last run are removed."""
+    published = set()
+    for path, sizes in written.items():
+        relative = Path(path).relative_to(source_root)
+        publish(path, root, sizes, relative)
+        published.add(relative.with_suffix('').as_posix())
+
+    prefixes = {name.rsplit('/', 1)[0] + '/' for name in published
+                if any(f'/{shards}/' in name for shards in SHARD_DIRS)}
+    manifest = read_manifest(root)
+    for name in [n for n in manifest if n not in published and any(n.startswith(p) for p in prefixes)]:
+        remove_published(root, manifest[name])
+        plain = Path(root) / f'{name}.json'
+        plain.unlink(missing_ok=True)
+        remove_compressed_siblings(plain)
+        del manifest[name]
+    write_manifest(root, manifest)
+
+
+def format_sizes(sizes):
+    """One-line summary like 'raw 30.12 MB, gz 2.95 MB (9.8%), br 2.10 MB (7.0%)'."""
+    parts = ['unchanged, not rewritten'] if sizes.get('skipped') else []
+    parts.append(f'raw {sizes["raw"] / (1024 * 1024):.2f} MB')
+    for key in ('gz', 'br'):
+        if key in sizes:
+            ratio = sizes[key] / sizes['raw'] * 100 if sizes['raw'] else 0
+            parts.append(f'{key} {sizes[key] / (1024 * 1024):.2f} MB ({ratio:.1f}%)')
+    if 'gz' in sizes and 'br' not in sizes:
+        parts.append('br skipped (brotli not installed)')
+    return ', '.join(parts)
+
+
+def remove_stale_shards(directory, shards, keep):
+    """Delete <directory>/<shards>/ files (and their manifest entries) whose stem is not in keep."""
+    directory = Path(directory)
+    shards_dir = directory / shards
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    keep = {str(key) for key in keep}
+
+    for stale in shards_dir.glob('*.json*'):
+        if stale.name.split('.')[0] not in keep:
+            stale.unlink()
+    manifest = read_manifest(directory.parent)
+    prefix = f'{directory.name}/{shards}/'
+    for name in [n for n in manifest if n.startswith(prefix) and n[len(prefix):-len('.json')] not in keep]:
+        del manifest[name]
+    write_manifest(directory.parent, manifest)
+    return shards_dir
+
+
+def write_sharded(data, directory, compact=True, precision=None):
+    """Write a {metadata, countries, country_lookup} dataset as an index plus one file per country.
+
+    Country files left over from a previous run are removed. Hashes are
+    recorded in the manifest of the directory's parent. Returns {path: sizes}.
+    """
+    directory = Path(directory)
+    countries_dir = remove_stale_shards(directory, 'countries', data['countries'])
+
+    written = {}
+    for geo, country in data['countries'].items():
+        path = countries_dir / f'{geo}.json'
+        written[path] = write_json(country, path, compact, precision, manifest_root=directory.parent)
+
+    index = {
+        'metadata': data['metadata'],
+        'country_lookup': data.get('country_lookup', {}),
+        'countries': {
+            geo: {'name': country['name'], 'years': sorted(int(year) for year in country['years'])}
+            for geo, country in data['countries'].items()
+        }
+    }
+    index_path = directory / 'index.json'
+    written[index_path] = write_json(index, index_path, compact, precision, manifest_root=directory.parent)
+
+    return written
+
+
+def year_snapshots(countries, fields):
+    """Regroup {geo: {'years': {year: entry}}} as {year: {geo: entry}}, keeping only `fields`.
+
+    `fields` maps an entry key to the sub-keys to keep (None keeps the whole
+    value). A country is left out of a year that has none of the fields.
+    """
+    snapshots = {}
+    for geo, country in countries.items():
+        for year, entry in country['years'].items():
+            kept = {}
+            for field, keys in fields.items():
+                value = entry.get(field)
+                if value is not None and keys is not None:
+                    value = {key: value[key] for key in keys if key in value}
+                if value:
+                    kept[field] = value
+            if kept:
+                snapshots.setdefault(int(year), {})[geo] = kept
+    return dict(sorted(snapshots.items()))
+
+
+def write_year_snapshots(snapshots, directory, compact=True, precision=None):
+    """Write {year: document} as <directory>/by_year/<year>.json; returns {path: sizes}.
+
+    Files for years no longer present are removed. Hashes are recorded in the
+    manifest of the directory's parent, as for write_sharded().
+    """
+    directory = Path(directory)
+    years_dir = remove_stale_shards(directory, 'by_year', snapshots)
+
+    written = {}
+    for year, document in snapshots.items():
+        path = years_dir / f'{year}.json'
+        written[path] = write_json(document, path, compact, precision, manifest_root=directory.parent)
+    return written
+
+
+def sharded_size(written):
+    """(index size, largest country file size, total size) in raw bytes."""
+    index = next((sizes['raw'] for path, sizes in written.items() if path.name == 'index.json'), 0)
+    shards = [sizes['raw'] for path, sizes in written.items() if path.name != 'index.json']
+    return index, max(shards, default=0), sum(sizes['raw'] for sizes in written.values())
@@ -0,0 +1,148 @@
+"""
+Cached loader for the OWID energy workbook (owid-energy-data.xlsx).
+
+Parsing the full workbook with pd.read_excel takes tens of seconds. load_owid()
+reads only the requested columns and keeps a parquet copy of them in
+data-processing/.cache/, keyed by the workbook's mtime, size and sha256, so
+only the first run after a workbook update pays the Excel cost:
+
+    from owid_loader import load_owid
+    df = load_owid(OWID_FILE, ['carbon_intensity_elec', 'population'])
+
+The cache holds every column requested so far; asking for a new column
+re-reads the workbook once. Without pyarrow the workbook is read on every run.
+
+owid_long() melts the loaded frame into (geo, year, column, value) rows for
+project countries; owid_production_consumption() turns those into the nested
+per-country lookup the scripts merge into their JSON, instead of a row-by-row
+walk.
+"""
+
+import hashlib
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import json_backend
+
+CACHE_DIR = Path(__file__).parent.parent / '.cache'
+KEY_COLUMNS = ['iso_code', 'year']
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def cache_paths(path, cache_dir):
+    return cache_dir / f'{path.stem}.parquet', cache_dir / f'{path.stem}.json'
+
+
+def valid_cache_info(path, cache_dir):
+    """Cache metadata if the cached copy matches the workbook, else None.
+
+    A changed mtime or size alone does not invalidate the cache (e.g. a fresh
+    checkout); the workbook is then hashed and compared.
+    """
+    data_path, info_path = cache_paths(path, cache_dir)
+    if not data_path.exists() or not info_path.exists():
+        return None
+    info = json_backend.load(info_path)
+    stat = path.stat()
+    if (info['mtime_ns'], info['size']) == (stat.st_mtime_ns, stat.st_size):
+        return info
+    if info['sha256'] != file_sha256(path):
+        return None
+    info.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    info_path.write_bytes(json_backend.dumps(info, indent=True))
+    return info
+
+
+def read_workbook(path, columns):
+    """Read the given columns (those that exist) of the workbook's first sheet."""
+    wanted = set(columns)
+    df = pd.read_excel(path, usecols=lambda column: column in wanted)
+    df['year'] = df['year'].astype('int64')
+    return df
+
+
+def load_owid(path, columns, cache_dir=CACHE_DIR):
+    """DataFrame with iso_code, year and the requested columns present in the OWID workbook."""
+    path, cache_dir = Path(path), Path(cache_dir)
+    wanted = list(dict.fromkeys(KEY_COLUMNS + list(columns)))
+    data_path, info_path = cache_paths(path, cache_dir)
+    t0 = time.time()
+
+    info = valid_cache_info(path, cache_dir)
+    if info is not None and set(wanted) <= set(info['requested']):
+        df = pd.read_parquet(data_path, columns=[c for c in wanted if c in info['columns']])
+        print(f'  Read {path.name} from cache {data_path} in {time.time()-t0:.1f}s')
+        return df
+
+    # Keep the columns cached for other scripts so they do not force another Excel read
+    requested = list(dict.fromkeys(wanted + (info['requested'] if info else [])))
+    df = read_workbook(path, requested)
+    print(f'  Parsed {path.name} ({len(df.columns)} of the requested columns) in {time.time()-t0:.1f}s')
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(data_path, index=False)
+    except ImportError as e:
+        print(f'  WARNING: OWID cache not written ({e})')
+    else:
+        stat = path.stat()
+        info = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': file_sha256(path),
+                'requested': requested, 'columns': list(df.columns)}
+        info_path.write_bytes(json_backend.dumps(info, indent=True))
+
+    return df[[c for c in wanted if c in df.columns]]
+
+
+def round_values(values, decimals):
+    """Round a float array like round(x, decimals); np.round can differ on ties since x * 10**decimals is inexact."""
+    scaled = values * 10 ** decimals
+    rounded = np.round(values, decimals)
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(x, decimals) for x in values[ties].tolist()]
+    return rounded
+
+
+def owid_long(df, owid_to_eurostat, columns):
+    """Non-missing cells of `columns` for project countries as (geo, year, column, value) rows.
+
+    Rows keep the workbook's row order, then the order of `columns`, so dicts
+    built from them have the same key order as a row-by-row walk.
+    """
+    frame = df[df['iso_code'].isin(owid_to_eurostat.keys())]
+    present = [c for c in columns if c in frame.columns]
+    long = (frame[present]
+            .assign(row=np.arange(len(frame)), geo=frame['iso_code'].map(owid_to_eurostat), year=frame['year'])
+            .melt(id_vars=['row', 'geo', 'year'], value_vars=present, var_name='column', value_name='value')
+            .dropna(subset=['value']))
+    long['slot'] = long['column'].map({column: i for i, column in enumerate(present)})
+    return long.sort_values(['row', 'slot'], kind='stable')
+
+
+def owid_production_consumption(df, owid_to_eurostat, production_cols, consumption_cols, decimals=3, year_key=int):
+    """{geo: {year: {'production': {code: value}, 'consumption': {code: value}}}} from OWID columns.
+
+    production_cols/consumption_cols map OWID columns to energy type codes.
+    Values are rounded to `decimals`; groups without values are left out, as
+    are country-years without any value.
+    """
+    long = owid_long(df, owid_to_eurostat, list(production_cols) + list(consumption_cols))
+    groups = long['column'].map(lambda column: 'production' if column in production_cols else 'consumption')
+    codes = long['column'].map(lambda column: production_cols.get(column) or consumption_cols[column])
+    values = round_values(long['value'].to_numpy(dtype='float64'), decimals)
+
+    lookup = {}
+    for geo, year, group, code, value in zip(long['geo'].tolist(), long['year'].tolist(), groups.tolist(),
+                                             codes.tolist(), values.tolist()):
+        lookup.setdefault(geo, {}).setdefault(year_key(year), {}).setdefault(group, {})[code] = value
+    return lookup
+
@@ -0,0 +1,111 @@
+"""
+Dense array representation of the aggregated Eurostat partner trade flows.
+
+The summed trade volumes are held in one float array indexed as
+values[flow, geo, partner, energy_type, year], with code-to-index lookups for
+every axis. Cells without any observation are NaN, so "no data" stays
+distinguishable from a reported zero.
+
+Built once from the trade intermediate by create_imports_exports_json.py
+(Phase 2) and saved as .npz, so other scripts can reload it without
+re-reading the 31.8M-row trade file:
+
+    from trade_cube import TradeCube
+    cube = TradeCube.load(path)
+    totals = cube.totals()  # (flow, geo, energy_type, year)
+"""
+
+import numpy as np
+import pandas as pd
+
+FLOWS = ['IMPORT', 'EXPORT']
+AXES = ['flow', 'geo', 'partner', 'energy_type', 'year']
+
+
+class TradeCube:
+    """Trade volumes as a (flow, geo, partner, energy_type, year) array."""
+
+    def __init__(self, values, geos, partners, energy_types, years, flows=FLOWS):
+        self.values = values
+        self.flows = [str(code) for code in flows]
+        self.geos = [str(code) for code in geos]
+        self.partners = [str(code) for code in partners]
+        self.energy_types = [str(code) for code in energy_types]
+        self.years = [int(y) for y in years]
+
+        self.flow_index = {code: i for i, code in enumerate(self.flows)}
+        self.geo_index = {code: i for i, code in enumerate(self.geos)}
+        self.partner_index = {code: i for i, code in enumerate(self.partners)}
+        self.energy_type_index = {code: i for i, code in enumerate(self.energy_types)}
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+
+    @classmethod
+    def from_trade_sums(cls, trade_sums):
+        """Build a cube from summed values indexed by (flow, geo, year, energy_type, partner)."""
+        frame = trade_sums.reset_index()
+        frame = frame[frame['flow'].isin(FLOWS)]
+
+        axes = {}
+        codes = {}
+        for axis in AXES[1:]:
+            codes[axis], axes[axis] = pd.factorize(frame[axis].astype(int if axis == 'year' else str), sort=True)
+        codes['flow'] = frame['flow'].map({flow: i for i, flow in enumerate(FLOWS)}).to_numpy()
+
+        shape = (len(FLOWS), len(axes['geo']), len(axes['partner']), len(axes['energy_type']), len(axes['year']))
+        values = np.full(shape, np.nan)
+        values[tuple(codes[axis] for axis in AXES)] = frame['value'].to_numpy(dtype='float64')
+
+        return cls(values, axes['geo'], axes['partner'], axes['energy_type'], axes['year'])
+
+    @classmethod
+    def load(cls, path):
+        """Load a cube saved with save()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['values'], data['geos'], data['partners'], data['energy_types'],
+                       data['years'], data['flows'])
+
+    def save(self, path):
+        """Save the cube as a compressed .npz file."""
+        np.savez_compressed(
+            path,
+            values=self.values,
+            flows=np.array(self.flows),
+            geos=np.array(self.geos),
+            partners=np.array(self.partners),
+            energy_types=np.array(self.energy_types),
+            years=np.array(self.years, dtype='int64'),
+        )
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def present(self):
+        """Boolean mask of cells holding at least one observation."""
+        return ~np.isnan(self.values)
+
+    def totals(self):
+        """Total per (flow, geo, energy_type, year), summed over partners; NaN if nothing reported."""
+        reported = self.present().any(axis=2)
+        return np.where(reported, np.nansum(self.values, axis=2), np.nan)
+
+    def partner_totals(self):
+        """Total per (flow, geo, partner, year), summed over energy types; NaN if nothing reported."""
+        reported = self.present().any(axis=3)
+        return np.where(reported, np.nansum(self.values, axis=3), np.nan)
+
+    def to_nested(self):
+        """Nested {geo: {year: {energy_type: {partner: value}}}} dicts as returned before the cube existed."""
+        nested = {'imports_by_partner': {}, 'exports_by_partner': {},
+                  'imports_totals': {}, 'exports_totals': {}}
+        totals = self.totals()
+
+        for f, g, p, e, y in zip(*np.nonzero(self.present())):
+            key = 'imports' if self.flows[f] == 'IMPORT' else 'exports'
+            geo, year, energy_type = self.geos[g], self.years[y], self.energy_types[e]
+            (nested[f'{key}_by_partner'].setdefault(geo, {}).setdefault(year, {})
+             .setdefault(energy_type, {}))[self.partners[p]] = float(self.values[f, g, p, e, y])
+            nested[f'{key}_totals'].setdefault(geo, {}).setdefault(year, {})[energy_type] = \
+                float(totals[f, g, e, y])
+
+        return nested
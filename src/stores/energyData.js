@@ -3,9 +3,13 @@ import { ref, computed, nextTick } from "vue";
 
 export const useEnergyDataStore = defineStore("energyData", () => {
   const rawData = ref(null);
+  // Sharded energy_mix: {geo: {name, years}} from index.json; country entries are fetched on selection
+  const countryIndex = ref(null);
   const consumptionsData = ref(null);
   const pricesData = ref(null);
   const ecoData = ref(null);
+  // by_year snapshots (one year across all countries): {"energy_mix/2020": {...}, "eco_data/2020": {...}}
+  const yearSnapshots = ref({});
   const selectedCountryCode = ref("IT");
   const selectedYear = ref(2023);
   const isLoading = ref(false);
@@ -15,8 +19,9 @@ export const useEnergyDataStore = defineStore("energyData", () => {
   const ecoLoaded = computed(() => Boolean(ecoData.value));
 
   const countries = computed(() => {
-    if (!rawData.value?.countries) return [];
-    return Object.entries(rawData.value.countries)
+    const source = countryIndex.value || rawData.value?.countries;
+    if (!source) return [];
+    return Object.entries(source)
       .map(([code, data]) => ({
         code,
         name: data.name,
@@ -27,7 +32,11 @@ export const useEnergyDataStore = defineStore("energyData", () => {
   const selectedCountry = computed(() => {
     if (!rawData.value?.countries || !selectedCountryCode.value) return null;
     const countryData = rawData.value.countries[selectedCountryCode.value];
-    if (!countryData) return null;
+    if (!countryData) {
+      // Sharded dataset while the country file loads: name only, year views use the snapshots
+      const indexed = countryIndex.value?.[selectedCountryCode.value];
+      return indexed ? { code: selectedCountryCode.value, name: indexed.name, years: null } : null;
+    }
     return {
       code: selectedCountryCode.value,
       name: countryData.name,
@@ -37,12 +46,16 @@ export const useEnergyDataStore = defineStore("energyData", () => {
 
   const metadata = computed(() => rawData.value?.metadata || null);
 
+  function yearSnapshot(dataset) {
+    return yearSnapshots.value[`${dataset}/${selectedYear.value}`] || null;
+  }
+
   // Available years for the selected country (newest first)
   const availableYears = computed(() => {
-    if (!selectedCountry.value?.years) return [];
-    return Object.keys(selectedCountry.value.years)
-      .map(Number)
-      .sort((a, b) => b - a);
+    const years = selectedCountry.value?.years
+      ? Object.keys(selectedCountry.value.years).map(Number)
+      : countryIndex.value?.[selectedCountryCode.value]?.years || [];
+    return [...years].sort((a, b) => b - a);
   });
 
   // Dependency data for the selected country and year
@@ -52,14 +65,45 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     return yearData?.dependency || null;
   });
 
+  // Schema v2 stores partners as [geo, value, share_pct] / [geo, share_pct] tuples and
+  // type totals as bare numbers; expand one flow back into the v1 objects the charts use
+  function expandTradeFlow(flow) {
+    if (!flow || metadata.value?.schema_version !== 2) return flow || null;
+    const lookup = rawData.value.country_lookup || {};
+    const units = metadata.value.energy_type_units || {};
+    const fields = metadata.value.partner_fields;
+    const toPartner = (tuple, names) => {
+      const partner = Object.fromEntries(names.map((name, i) => [name, tuple[i]]));
+      partner.name = lookup[partner.geo] || partner.geo;
+      return partner;
+    };
+
+    const expanded = { total_by_type: {} };
+    for (const [code, value] of Object.entries(flow.total_by_type || {})) {
+      expanded.total_by_type[code] = { value, unit: units[code] || "UNKNOWN" };
+    }
+    if (flow.partners_by_type) {
+      expanded.partners_by_type = {};
+      for (const [code, partners] of Object.entries(flow.partners_by_type)) {
+        expanded.partners_by_type[code] = partners.map((p) => toPartner(p, fields.partners_by_type));
+      }
+    }
+    if (flow.partners) {
+      expanded.partners = flow.partners.map((p) => toPartner(p, fields.partners));
+    }
+    return expanded;
+  }
+
   // Trade data (imports/exports with partners) for the selected country and year
   const tradeData = computed(() => {
-    if (!selectedCountry.value?.years || !selectedYear.value) return null;
-    const yearData = selectedCountry.value.years[selectedYear.value];
+    if (!selectedCountry.value || !selectedYear.value) return null;
+    const yearData = selectedCountry.value.years
+      ? selectedCountry.value.years[selectedYear.value]
+      : yearSnapshot("energy_mix")?.countries?.[selectedCountryCode.value];
     if (!yearData) return null;
     return {
-      imports: yearData.imports || null,
-      exports: yearData.exports || null,
+      imports: expandTradeFlow(yearData.imports),
+      exports: expandTradeFlow(yearData.exports),
     };
   });
 
@@ -74,9 +118,23 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     };
   });
 
+  // Precomputed sunburst/pie rollup of the selected country and year (null for datasets without rollups)
+  const consumptionRollup = computed(() => {
+    if (!consumptionsData.value?.rollups || !selectedCountry.value?.name || !selectedYear.value) return null;
+    return consumptionsData.value.rollups[selectedCountry.value.name]?.[selectedYear.value] || {};
+  });
+
   const pieChartData = computed(() => {
     if (!consumptionsData.value || !selectedCountry.value?.name || !selectedYear.value) return [];
 
+    const rollup = consumptionRollup.value;
+    if (rollup) {
+      if (!rollup.pie) return [];
+      return ["Industry", "Residential", "Transport", "Service"].map((sector) =>
+        rollup.pie[sector] ? { name: sector, energyType: rollup.pie[sector] } : null,
+      );
+    }
+
     const countryData = consumptionsData.value.countries[selectedCountry.value.name];
     if (!countryData) return [];
 
@@ -119,6 +177,15 @@ export const useEnergyDataStore = defineStore("energyData", () => {
   const sunburstData = computed(() => {
     if (!consumptionsData.value || !selectedCountry.value?.name || !selectedYear.value) return [];
 
+    const rollup = consumptionRollup.value;
+    if (rollup) {
+      if (!rollup.sunburst) return [];
+      return {
+        name: selectedCountry.value.name + " " + selectedYear.value,
+        children: rollup.sunburst,
+      };
+    }
+
     const countryData = consumptionsData.value.countries[selectedCountry.value.name];
     if (!countryData) return [];
 
@@ -155,13 +222,13 @@ export const useEnergyDataStore = defineStore("energyData", () => {
                 sectorChildren.push({ name: endUseName, value: endUseTotal });
                 total += endUseTotal;
               }
-              if (total === 0) {
-                const totalTransport = yearData["Total passenger and freight transport"];
-                if (totalTransport) {
-                  total = totalTransport.products?.["Total final use (PJ)"] || 0;
-                }
-              }
             });
+            if (total === 0) {
+              const totalTransport = yearData["Total passenger and freight transport"];
+              if (totalTransport) {
+                total = totalTransport.products?.["Total final use (PJ)"] || 0;
+              }
+            }
             break;
           default: // Residential, Service
             Object.entries(yearData).forEach(([endUseName, endUseData]) => {
@@ -174,7 +241,7 @@ export const useEnergyDataStore = defineStore("energyData", () => {
             });
             if (total == 0) {
               Object.entries(yearData).forEach(([endUseName, endUseData]) => {
-                if ((endUseName = "Total residential" || endUseName == "Total services")) {
+                if (endUseName.includes("Total residential") || endUseName.includes("Total services")) {
                   const products = endUseData.products || {};
                   const endUseTotal = products["Total final use (PJ)"] || 0;
                   total += endUseTotal;
@@ -204,28 +271,39 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     return country?.carbon_intensity || null;
   });
 
-  // Carbon intensity ranking (all countries sorted ascending)
+  // Carbon intensity ranking (all countries sorted ascending); the selected year when it has data
   const carbonIntensityRanking = computed(() => {
+    const snapshot = yearSnapshot("eco_data");
+    if (snapshot?.carbon_intensity_ranking?.length) return snapshot.carbon_intensity_ranking;
     if (!ecoData.value?.carbon_intensity_ranking) return [];
     return ecoData.value.carbon_intensity_ranking;
   });
 
+  // Sector values of the selected year from the country's series (eco_data built with --series), else the latest
+  function ecoSectors(country, key) {
+    const yearData = country?.series?.[selectedYear.value]?.[key];
+    if (yearData) return { year: selectedYear.value, ...yearData };
+    return country?.[key] || null;
+  }
+
   // Per-capita emissions by sector for selected country
   const emissionsPerCapita = computed(() => {
     if (!ecoData.value?.countries || !selectedCountryCode.value) return null;
     const country = ecoData.value.countries[selectedCountryCode.value];
-    return country?.emissions_per_capita || null;
+    return ecoSectors(country, "emissions_per_capita");
   });
 
   // Total emissions (kt CO2) by sector for selected country
   const emissionsTotal = computed(() => {
     if (!ecoData.value?.countries || !selectedCountryCode.value) return null;
     const country = ecoData.value.countries[selectedCountryCode.value];
-    return country?.emissions_total_kt || null;
+    return ecoSectors(country, "emissions_total_kt");
   });
 
-  // Emissions per capita ranking (all countries, sum of sectors, sorted ascending)
+  // Emissions per capita ranking (all countries, sum of sectors, sorted ascending); the selected year when it has data
   const emissionsPerCapitaRanking = computed(() => {
+    const snapshot = yearSnapshot("eco_data");
+    if (snapshot?.emissions_per_capita_ranking?.length) return snapshot.emissions_per_capita_ranking;
     if (!ecoData.value?.countries) return [];
 
     const ranking = [];
@@ -274,6 +352,52 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     });
   });
 
+  // data/manifest.json maps dataset names to content-hashed files: {name: {file, sha256, size}}
+  let manifest = {};
+
+  async function loadManifest() {
+    try {
+      const response = await fetch(`${import.meta.env.BASE_URL}data/manifest.json`, { cache: "no-cache" });
+      manifest = response.ok ? await response.json() : {};
+    } catch {
+      manifest = {};
+    }
+  }
+
+  // URL of a dataset ("eco_data", "energy_mix/countries/IT"); the plain file name when not in the manifest
+  function datasetUrl(name) {
+    return `${import.meta.env.BASE_URL}data/${manifest[name]?.file || `${name}.json`}`;
+  }
+
+  async function fetchDataset(name) {
+    const response = await fetch(datasetUrl(name));
+    if (!response.ok) throw new Error(`${name}: HTTP ${response.status}`);
+    const text = await response.text();
+    // Handle NaN values in JSON (convert to null)
+    return JSON.parse(text.replace(/:\s*NaN/g, ": null"));
+  }
+
+  // Fetch one country of the sharded energy_mix dataset (no-op for the single-file dataset)
+  async function loadCountry(code) {
+    if (!countryIndex.value?.[code] || rawData.value.countries[code]) return;
+    rawData.value.countries[code] = await fetchDataset(`energy_mix/countries/${code}`);
+  }
+
+  // Fetch the by_year snapshot of a dataset (skipped when the manifest does not list one)
+  async function loadYearSnapshot(dataset, year) {
+    const key = `${dataset}/${year}`;
+    if (yearSnapshots.value[key] || !manifest[`${dataset}/by_year/${year}`]) return;
+    yearSnapshots.value[key] = await fetchDataset(`${dataset}/by_year/${year}`);
+  }
+
+  // The single-file energy_mix already holds every year, so its snapshots are only used when sharded
+  function loadYear(year) {
+    const datasets = countryIndex.value ? ["energy_mix", "eco_data"] : ["eco_data"];
+    return Promise.all(datasets.map((dataset) => loadYearSnapshot(dataset, year))).catch((err) => {
+      console.warn(`Year snapshots for ${year} not loaded`, err);
+    });
+  }
+
   async function loadData() {
     if (rawData.value && consumptionsData.value && pricesData.value) return;
 
@@ -281,23 +405,24 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     error.value = null;
 
     try {
-      const dependencyJSON = await fetch(`${import.meta.env.BASE_URL}data/energy_mix.json`);
-      const dependencyText = await dependencyJSON.text();
-      // Handle NaN values in JSON (convert to null)
-      const dependencyCleanedText = dependencyText.replace(/:\s*NaN/g, ": null");
-      rawData.value = JSON.parse(dependencyCleanedText);
+      await loadManifest();
 
-      const consumptionJSON = await fetch(`${import.meta.env.BASE_URL}data/energy_consumptions_by_sector.json`);
-      const consumptionText = await consumptionJSON.text();
-      const consumptionCleanedText = consumptionText.replace(/:\s*NaN/g, ": null");
-      consumptionsData.value = JSON.parse(consumptionCleanedText);
+      // Prefer the sharded dataset (index + selected country); fall back to the single file
+      try {
+        const index = await fetchDataset("energy_mix/index");
+        rawData.value = { metadata: index.metadata, country_lookup: index.country_lookup, countries: {} };
+        countryIndex.value = index.countries;
+        await loadCountry(selectedCountryCode.value);
+      } catch {
+        countryIndex.value = null;
+        rawData.value = await fetchDataset("energy_mix");
+      }
+
+      consumptionsData.value = await fetchDataset("energy_consumptions_by_sector");
 
       // Load prepared energy prices (quarterly CPI + annual electricity prices)
       try {
-        const pricesJSON = await fetch(`${import.meta.env.BASE_URL}data/energy_prices.json`);
-        const pricesText = await pricesJSON.text();
-        const pricesCleaned = pricesText.replace(/:\s*NaN/g, ": null");
-        pricesData.value = JSON.parse(pricesCleaned);
+        pricesData.value = await fetchDataset("energy_prices");
       } catch (err) {
         // Non-fatal: leave pricesData null and surface later
         console.warn("Failed to load energy_prices.json", err);
@@ -306,13 +431,13 @@ export const useEnergyDataStore = defineStore("energyData", () => {
 
       // Load eco data (carbon intensity + emissions per capita)
       try {
-        const ecoJSON = await fetch(`${import.meta.env.BASE_URL}data/eco_data.json`);
-        const ecoText = await ecoJSON.text();
-        ecoData.value = JSON.parse(ecoText.replace(/:\s*NaN/g, ": null"));
+        ecoData.value = await fetchDataset("eco_data");
       } catch (err) {
         console.warn("eco_data.json not loaded", err);
         ecoData.value = null;
       }
+
+      await loadYear(selectedYear.value);
     } catch (e) {
       error.value = e.message;
       console.error("Failed to load energy data:", e);
@@ -323,13 +448,18 @@ export const useEnergyDataStore = defineStore("energyData", () => {
 
   function setSelectedCountry(code) {
     selectedCountryCode.value = code;
+    loadCountry(code).catch((e) => {
+      error.value = e.message;
+      console.error(`Failed to load energy data for ${code}:`, e);
+    });
   }
 
   function setSelectedYear(year) {
     if (year === selectedYear.value) return;
     isYearChanging.value = true;
     // Defer the actual data change so the spinner renders first
-    requestAnimationFrame(() => {
+    requestAnimationFrame(async () => {
+      await loadYear(year);
       selectedYear.value = year;
       nextTick(() => {
         isYearChanging.value = false;
@@ -354,6 +484,8 @@ export const useEnergyDataStore = defineStore("energyData", () => {
     pieChartData,
     sunburstData,
     loadData,
+    loadCountry,
+    loadYear,
     setSelectedCountry,
     setSelectedYear,
     pricesData,